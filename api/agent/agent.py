@@ -1,19 +1,36 @@
 import os
 import enum
+import time
+import asyncio
 import json
+import logging
 import openai
 import dotenv
+from jiter import from_json
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, AsyncIterator, Tuple, Any
 from api.agent.prompt import SYSTEM_PROMPT
+from api.log import sampled
+from api.metrics import llm_request_seconds, llm_tokens, observe_since
 from api.agent.zerepy import (
     get_balance,
     transfer_sonic_custom,
     sonic_custom_swap,
+    async_get_balance,
+    async_transfer_sonic_custom,
+    async_sonic_custom_swap,
+    invalidate_balances,
+    ZerePyError,
 )
 
 dotenv.load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Global limit of in-flight LLM calls, excess calls wait in line for a slot
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "256"))
+llm_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
 
 class Action(enum.Enum):
     CHAT = "chat"
@@ -70,7 +87,9 @@ def process_response(response: AgentResponse, private_key: Optional[str] = None)
         match response.action:
             case Action.CHAT:
                 chat_data = response.data
-                print(f"Chat Response: {chat_data.message}")
+                logger.debug(
+                    "chat response, %d chars", len(chat_data.message), extra=sampled()
+                )
                 return {
                     "status": "success",
                     "action": Action.CHAT,
@@ -80,7 +99,12 @@ def process_response(response: AgentResponse, private_key: Optional[str] = None)
             case Action.BALANCE:
                 balance_data = response.data
                 res = get_balance(balance_data.address, balance_data.asset)
-                print(f"Balance response: {balance_data}")
+                logger.info(
+                    "balance %s of %s",
+                    balance_data.asset,
+                    balance_data.address,
+                    extra=sampled(),
+                )
                 return {
                     "status": "success",
                     "action": Action.BALANCE,
@@ -89,8 +113,11 @@ def process_response(response: AgentResponse, private_key: Optional[str] = None)
 
             case Action.SWAP:
                 swap_data = response.data
-                print(
-                    f"Swap: {swap_data.amount} {swap_data.token_in} to {swap_data.token_out}"
+                logger.info(
+                    "swap %s %s to %s",
+                    swap_data.amount,
+                    swap_data.token_in,
+                    swap_data.token_out,
                 )
                 res = sonic_custom_swap(
                     token_in=swap_data.token_in,
@@ -106,8 +133,12 @@ def process_response(response: AgentResponse, private_key: Optional[str] = None)
 
             case Action.WITHDRAW:
                 withdraw_data = response.data
-                print(
-                    f"Withdraw:{withdraw_data.amount} from {withdraw_data.from_address} to {withdraw_data.to_address}"
+                logger.info(
+                    "withdraw %s %s from %s to %s",
+                    withdraw_data.amount,
+                    withdraw_data.asset,
+                    withdraw_data.from_address,
+                    withdraw_data.to_address,
                 )
                 res = transfer_sonic_custom(
                     to_address=withdraw_data.to_address,
@@ -135,6 +166,127 @@ def process_response(response: AgentResponse, private_key: Optional[str] = None)
         }
 
 
+TRANSACTION_ACTIONS = (Action.SWAP, Action.WITHDRAW)
+
+
+async def async_execute_transaction(
+    response: AgentResponse,
+    private_key: Optional[str] = None,
+    address: Optional[str] = None,
+):
+    """Broadcast a swap or withdraw and return the ZerePy result, raises on failure"""
+    match response.action:
+        case Action.SWAP:
+            swap_data = response.data
+            logger.info(
+                "swap %s %s to %s",
+                swap_data.amount,
+                swap_data.token_in,
+                swap_data.token_out,
+            )
+            res = await async_sonic_custom_swap(
+                token_in=swap_data.token_in,
+                token_out=swap_data.token_out,
+                amount=str(swap_data.amount),
+                private_key=private_key,
+            )
+            invalidate_balances(address)
+            return res["result"]
+
+        case Action.WITHDRAW:
+            withdraw_data = response.data
+            logger.info(
+                "withdraw %s %s from %s to %s",
+                withdraw_data.amount,
+                withdraw_data.asset,
+                withdraw_data.from_address,
+                withdraw_data.to_address,
+            )
+            res = await async_transfer_sonic_custom(
+                to_address=withdraw_data.to_address,
+                amount=str(withdraw_data.amount),
+                private_key=private_key,
+                token_address=withdraw_data.asset,
+            )
+            invalidate_balances(address)
+            invalidate_balances(withdraw_data.to_address)
+            return res["result"]
+
+    raise ValueError(f"Not a transaction: {response.action}")
+
+
+# Async version of process_response, awaits the ZerePy calls instead of blocking
+# `address` is the wallet of private_key, its cached balances are dropped
+# after a successful swap or withdraw
+async def async_process_response(
+    response: AgentResponse,
+    private_key: Optional[str] = None,
+    address: Optional[str] = None,
+):
+    if not response.success:
+        return {
+            "status": "error",
+            "action": response.action,
+            "result": response.error,
+        }
+
+    try:
+        match response.action:
+            case Action.CHAT:
+                chat_data = response.data
+                logger.debug(
+                    "chat response, %d chars", len(chat_data.message), extra=sampled()
+                )
+                return {
+                    "status": "success",
+                    "action": Action.CHAT,
+                    "result": chat_data.message,
+                }
+
+            case Action.BALANCE:
+                balance_data = response.data
+                res = await async_get_balance(
+                    balance_data.address, balance_data.asset
+                )
+                logger.info(
+                    "balance %s of %s",
+                    balance_data.asset,
+                    balance_data.address,
+                    extra=sampled(),
+                )
+                return {
+                    "status": "success",
+                    "action": Action.BALANCE,
+                    "result": res["result"],
+                }
+
+            case Action.SWAP | Action.WITHDRAW:
+                result = await async_execute_transaction(
+                    response, private_key=private_key, address=address
+                )
+                return {
+                    "status": "success",
+                    "action": response.action,
+                    "result": result,
+                }
+
+            case _:
+                return {
+                    "status": "error",
+                    "action": Action.CHAT,
+                    "result": "I don't understand your request, can you please be more specific?",
+                }
+    except ZerePyError:
+        # upstream failures are reported as such, see main.py
+        raise
+    except:
+        return {
+            "status": "error",
+            "action": Action.CHAT,
+            "result": "I don't understand your request, can you please be more specific?",
+        }
+
+
 class Agent:
     def __init__(self, model: str):
         self.model = model
@@ -155,6 +307,102 @@ class Agent:
         return response.choices[0].message.parsed
 
 
+class AsyncAgent:
+    def __init__(self, model: str):
+        self.model = model
+        # created on first use or by warmup(), not at import
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self.warmup_error: Optional[str] = None
+        # running totals of the usage reported by OpenAI
+        self.usage = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    async def warmup(self):
+        """Create the client and open a pooled connection to the API"""
+        try:
+            await self.client.models.list()
+            self.warmup_error = None
+        except Exception as e:
+            self.warmup_error = str(e)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += usage.prompt_tokens
+        self.usage["cached_tokens"] += cached_tokens
+        self.usage["completion_tokens"] += usage.completion_tokens
+        llm_tokens.inc(self.model, "prompt", amount=usage.prompt_tokens)
+        llm_tokens.inc(self.model, "cached", amount=cached_tokens)
+        llm_tokens.inc(self.model, "completion", amount=usage.completion_tokens)
+
+    async def structured_call(
+        self, system_prompt: str, messages: List[Dict[str, str]]
+    ) -> AgentResponse:
+        async with llm_semaphore:
+            start = time.perf_counter()
+            response = await self.client.beta.chat.completions.parse(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    *messages,
+                ],
+                temperature=0.7,
+                response_format=AgentResponse,
+            )
+            observe_since(llm_request_seconds, start, self.model, "call")
+        self.record_usage(response.usage)
+        return response.choices[0].message.parsed
+
+    async def structured_stream(
+        self, system_prompt: str, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream a structured call.
+
+        Yields ("partial", dict) for every partially parsed snapshot of the
+        output and a single ("final", AgentResponse) once the completion ends.
+        """
+        async with llm_semaphore:
+            start = time.perf_counter()
+            async with self.client.beta.chat.completions.stream(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    *messages,
+                ],
+                temperature=0.7,
+                response_format=AgentResponse,
+                stream_options={"include_usage": True},
+            ) as stream:
+                async for event in stream:
+                    if event.type == "content.delta" and event.snapshot:
+                        # unlike event.parsed, keep unterminated strings so
+                        # chat text can be forwarded while it is generated
+                        yield "partial", from_json(
+                            event.snapshot.encode(), partial_mode="trailing-strings"
+                        )
+                completion = await stream.get_final_completion()
+            observe_since(llm_request_seconds, start, self.model, "stream")
+        self.record_usage(completion.usage)
+        yield "final", completion.choices[0].message.parsed
+
+
 if __name__ == "__main__":
     agent = Agent(model=os.getenv("OPENAI_MODEL"), system_prompt=SYSTEM_PROMPT)
     response = agent.structured_call(
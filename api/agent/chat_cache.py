@@ -0,0 +1,72 @@
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from api.cache import TTLCache
+from api.agent.agent import Action, AgentResponse
+
+load_dotenv()
+
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "0") == "1"
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "256"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "600"))
+CHAT_CACHE_TURNS = int(os.getenv("CHAT_CACHE_TURNS", "3"))
+
+# agent id => cache of (agent version, normalized recent turns) => AgentResponse
+caches: Dict[int, TTLCache] = {}
+stores = 0
+bypassed = 0
+
+
+def cache_key(version: Optional[int], messages: List[Dict[str, str]]):
+    turns = tuple(
+        (message["role"], " ".join(message["content"].lower().split()))
+        for message in messages[-CHAT_CACHE_TURNS:]
+    )
+    return (version, turns)
+
+
+def get_cached_chat(
+    agent_id: int, version: Optional[int], messages: List[Dict[str, str]]
+) -> Optional[AgentResponse]:
+    cache = caches.get(agent_id)
+    if cache is None:
+        cache = caches.setdefault(agent_id, TTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL))
+    return cache.get(cache_key(version, messages))
+
+
+def store_chat(
+    agent_id: int,
+    version: Optional[int],
+    messages: List[Dict[str, str]],
+    response: AgentResponse,
+):
+    """Cache successful chat answers, every other action is always recomputed"""
+    global stores
+    if not response.success or response.action != Action.CHAT:
+        return
+    cache = caches.setdefault(agent_id, TTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL))
+    cache.set(cache_key(version, messages), response)
+    stores += 1
+
+
+def record_bypass():
+    global bypassed
+    bypassed += 1
+
+
+def invalidate_chat_cache(agent_id: int):
+    caches.pop(agent_id, None)
+
+
+def stats():
+    return {
+        "enabled": CHAT_CACHE_ENABLED,
+        "agents": len(caches),
+        "size": sum(len(cache) for cache in caches.values()),
+        "hits": sum(cache.hits for cache in caches.values()),
+        "misses": sum(cache.misses for cache in caches.values()),
+        "stores": stores,
+        "bypassed": bypassed,
+    }
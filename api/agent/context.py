@@ -0,0 +1,50 @@
+import os
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "3000"))
+CONVERSATION_FULL_TURNS = int(os.getenv("CONVERSATION_FULL_TURNS", "6"))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "200"))
+TRIMMED_TURN_CHARS = int(os.getenv("CONVERSATION_TRIMMED_TURN_CHARS", "280"))
+
+# rough per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, about four characters per token for English"""
+    return len(text) // 4 + MESSAGE_OVERHEAD
+
+
+def trim(text: str, limit: int = TRIMMED_TURN_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return text[: limit - 3].rstrip() + "..."
+
+
+def window_messages(
+    newest_first: List[Dict[str, str]],
+    budget: int = CONVERSATION_TOKEN_BUDGET,
+    full_turns: int = CONVERSATION_FULL_TURNS,
+) -> List[Dict[str, str]]:
+    """Fit a conversation into a token budget.
+
+    The `full_turns` most recent messages are kept whole, older ones are
+    trimmed to TRIMMED_TURN_CHARS, and the window stops at the first message
+    that no longer fits. The newest message is always kept. Returns the
+    window oldest first.
+    """
+    window = []
+    used = 0
+    for index, message in enumerate(newest_first):
+        content = message["content"] if index < full_turns else trim(message["content"])
+        cost = estimate_tokens(content)
+        if window and used + cost > budget:
+            break
+        window.append({"role": message["role"], "content": content})
+        used += cost
+    window.reverse()
+    return window
@@ -0,0 +1,129 @@
+import re
+import logging
+from typing import Optional
+
+from api.agent.agent import (
+    Action,
+    AgentResponse,
+    BalanceResponse,
+    SwapResponse,
+    WithdrawResponse,
+)
+
+logger = logging.getLogger(__name__)
+
+NATIVE = "0xnative"
+ADDRESS = r"0x[0-9a-fA-F]{40}"
+TOKEN = rf"(?:{ADDRESS}|0xnative|native|sonic|s)"
+AMOUNT = r"\d+(?:\.\d+)?"
+
+BALANCE_PATTERNS = [
+    re.compile(
+        rf"^(?:(?:what(?:'s| is)|show|check|get)\s+)?(?:my\s+)?(?:(?P<token>{TOKEN})\s+)?balance(?:\s+(?:of|for)\s+(?P<token_of>{TOKEN}))?$",
+        re.IGNORECASE,
+    ),
+]
+SWAP_PATTERN = re.compile(
+    rf"^swap\s+(?P<amount>{AMOUNT})\s+(?:of\s+)?(?P<token_in>{TOKEN})\s+(?:to|for|into)\s+(?P<token_out>{TOKEN})$",
+    re.IGNORECASE,
+)
+WITHDRAW_PATTERN = re.compile(
+    rf"^(?:send|transfer|withdraw)\s+(?P<amount>{AMOUNT})\s+(?:(?P<asset>{TOKEN})\s+)?to\s+(?P<to_address>{ADDRESS})$",
+    re.IGNORECASE,
+)
+
+# how often the match rate is logged, in parsed prompts
+LOG_EVERY = 100
+
+stats = {"prompts": 0, "matched": 0, Action.BALANCE.value: 0, Action.SWAP.value: 0, Action.WITHDRAW.value: 0}
+
+
+def normalize_token(token: Optional[str]) -> str:
+    if token is None or token.lower() in ("s", "sonic", "native", NATIVE):
+        return NATIVE
+    return token
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.strip().rstrip("?.!").split())
+
+
+def match_intent(prompt: str, address: str) -> Optional[AgentResponse]:
+    prompt = normalize_prompt(prompt)
+
+    for pattern in BALANCE_PATTERNS:
+        match = pattern.match(prompt)
+        if match:
+            if match["token"] and match["token_of"]:
+                return None
+            return AgentResponse(
+                success=True,
+                action=Action.BALANCE,
+                data=BalanceResponse(
+                    address=address,
+                    asset=normalize_token(match["token"] or match["token_of"]),
+                    action=Action.BALANCE,
+                ),
+            )
+
+    match = SWAP_PATTERN.match(prompt)
+    if match:
+        # a zero amount is not something to queue a transaction for
+        if float(match["amount"]) <= 0:
+            return None
+        token_in = normalize_token(match["token_in"])
+        token_out = normalize_token(match["token_out"])
+        if token_in.lower() == token_out.lower():
+            return None
+        return AgentResponse(
+            success=True,
+            action=Action.SWAP,
+            data=SwapResponse(
+                token_in=token_in,
+                token_out=token_out,
+                amount=float(match["amount"]),
+                action=Action.SWAP,
+            ),
+        )
+
+    match = WITHDRAW_PATTERN.match(prompt)
+    if match:
+        if float(match["amount"]) <= 0:
+            return None
+        return AgentResponse(
+            success=True,
+            action=Action.WITHDRAW,
+            data=WithdrawResponse(
+                from_address=address,
+                to_address=match["to_address"],
+                amount=float(match["amount"]),
+                asset=normalize_token(match["asset"]),
+                action=Action.WITHDRAW,
+            ),
+        )
+
+    return None
+
+
+def parse_intent(prompt: Optional[str], address: str) -> Optional[AgentResponse]:
+    """Rule based parser for unambiguous mechanical prompts.
+
+    Returns the AgentResponse the LLM would have produced, or None when the
+    prompt should go to the LLM.
+    """
+    if not prompt:
+        return None
+    response = match_intent(prompt, address)
+
+    stats["prompts"] += 1
+    if response is not None:
+        stats["matched"] += 1
+        stats[response.action.value] += 1
+    if stats["prompts"] % LOG_EVERY == 0:
+        logger.info(
+            "intent fast path matched %d/%d prompts (%.1f%%)",
+            stats["matched"],
+            stats["prompts"],
+            100 * stats["matched"] / stats["prompts"],
+        )
+    return response
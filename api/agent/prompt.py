@@ -1,4 +1,9 @@
+import os
 from api.models import AIAgent
+from api.cache import TTLCache
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "3600"))
 
 SYSTEM_PROMPT = """
 You are an agent that is used in an application that is used as an trading agent.
@@ -15,13 +20,32 @@ You will then return a response as its given in the response_format, if there is
 """
 
 
+# agent id => (agent version, compiled system prompt)
+prompt_cache = TTLCache(maxsize=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL)
+
+
+def build_system_prompt(agent: AIAgent):
+    # the static instructions come first so every agent shares the same
+    # prompt prefix and the provider can reuse its prompt cache
+    return f"""{SYSTEM_PROMPT}
+--------------------------------------------------------
+you are an agent named {agent.agent_name}
+your bio is {agent.agent_bio}
+your traits are {agent.traits}
+--------------------------------------------------------
+"""
+
+
 def get_system_prompt(agent: AIAgent):
-    return f"""
-    --------------------------------------------------------
-    you are an agent named {agent.agent_name}
-    your bio is {agent.agent_bio}
-    your traits are {agent.traits}
-    --------------------------------------------------------
-    {SYSTEM_PROMPT}
-    --------------------------------------------------------
-    """
+    if agent.id is None:
+        return build_system_prompt(agent)
+    cached = prompt_cache.get(agent.id)
+    if cached is not None and cached[0] == agent.version:
+        return cached[1]
+    system_prompt = build_system_prompt(agent)
+    prompt_cache.set(agent.id, (agent.version, system_prompt))
+    return system_prompt
+
+
+def invalidate_system_prompt(agent_id: int):
+    prompt_cache.pop(agent_id)
@@ -0,0 +1,14 @@
+from typing import Optional
+
+
+def evm_address_from_key(private_key: Optional[str]) -> Optional[str]:
+    """Derive the checksummed EVM address of a private key, None if invalid"""
+    if not private_key:
+        return None
+    # web3 takes over a second to import, only pay for it when a key is used
+    from web3 import Account
+
+    try:
+        return Account.from_key(private_key).address
+    except (ValueError, TypeError):
+        return None
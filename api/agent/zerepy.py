@@ -1,7 +1,11 @@
 import enum
 import time
-from typing import Optional
-from api.agent.zerepy_client import ZerePyClient
+import asyncio
+import logging
+from typing import Dict, Hashable, List, Optional
+from api.agent.zerepy_client import ZerePyClient, AsyncZerePyClient, ZerePyError
+from api.cache import TTLCache
+from api.log import sampled
 
 from dotenv import load_dotenv
 import os
@@ -9,6 +13,8 @@ import os
 # Load environment variables from .env.test
 load_dotenv(".env")
 
+logger = logging.getLogger(__name__)
+
 
 class TransferActions(enum.Enum):
     WITHDRAW = "withdraw"
@@ -23,8 +29,146 @@ AMOUNT = 0.0001
 EVM_PRIVATE_KEY = os.getenv("TEST_PRIVATE_KEY")
 AFTER_BROADCAST = 15
 
+ZEREPY_URL = os.getenv("ZEREPY_URL", "http://localhost:8000")
+ZEREPY_AGENT = os.getenv("ZEREPY_AGENT", "etheth")
+# keep-alive connections opened at startup
+ZEREPY_PREWARM_CONNECTIONS = int(os.getenv("ZEREPY_PREWARM_CONNECTIONS", "2"))
+ZEREPY_CONNECT_RETRY_MAX = float(os.getenv("ZEREPY_CONNECT_RETRY_MAX", "30"))
+ZEREPY_CONNECT_TIMEOUT = float(os.getenv("ZEREPY_CONNECT_TIMEOUT", "3"))
+ZEREPY_READ_TIMEOUT = float(os.getenv("ZEREPY_READ_TIMEOUT", "10"))
+ZEREPY_TX_READ_TIMEOUT = float(os.getenv("ZEREPY_TX_READ_TIMEOUT", "120"))
+ZEREPY_MAX_CONNECTIONS = int(os.getenv("ZEREPY_MAX_CONNECTIONS", "20"))
+ZEREPY_MAX_CONCURRENCY = int(os.getenv("ZEREPY_MAX_CONCURRENCY", "20"))
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "15"))
+BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", "4096"))
+ZEREPY_RETRIES = int(os.getenv("ZEREPY_RETRIES", "2"))
+ZEREPY_BACKOFF_BASE = float(os.getenv("ZEREPY_BACKOFF_BASE", "0.1"))
+ZEREPY_BACKOFF_MAX = float(os.getenv("ZEREPY_BACKOFF_MAX", "2"))
+ZEREPY_BREAKER_FAILURES = int(os.getenv("ZEREPY_BREAKER_FAILURES", "5"))
+ZEREPY_BREAKER_RESET = float(os.getenv("ZEREPY_BREAKER_RESET", "30"))
+# hedge get-balance calls still running after this many seconds, 0 disables
+ZEREPY_HEDGE_AFTER = float(os.getenv("ZEREPY_HEDGE_AFTER", "0"))
+PORTFOLIO_CONCURRENCY = int(os.getenv("PORTFOLIO_CONCURRENCY", "8"))
+PORTFOLIO_TOKEN_TIMEOUT = float(os.getenv("PORTFOLIO_TOKEN_TIMEOUT", "5"))
+
+
+client = ZerePyClient(ZEREPY_URL)
+
+async_client = AsyncZerePyClient(
+    ZEREPY_URL,
+    timeout=(ZEREPY_CONNECT_TIMEOUT, ZEREPY_READ_TIMEOUT),
+    action_timeouts={
+        "get-balance": (ZEREPY_CONNECT_TIMEOUT, ZEREPY_READ_TIMEOUT),
+        "custom-transfer": (ZEREPY_CONNECT_TIMEOUT, ZEREPY_TX_READ_TIMEOUT),
+        "custom-swap": (ZEREPY_CONNECT_TIMEOUT, ZEREPY_TX_READ_TIMEOUT),
+    },
+    max_connections=ZEREPY_MAX_CONNECTIONS,
+    max_concurrency=ZEREPY_MAX_CONCURRENCY,
+    retries=ZEREPY_RETRIES,
+    backoff_base=ZEREPY_BACKOFF_BASE,
+    backoff_max=ZEREPY_BACKOFF_MAX,
+    breaker_failures=ZEREPY_BREAKER_FAILURES,
+    breaker_reset=ZEREPY_BREAKER_RESET,
+    hedge_after=ZEREPY_HEDGE_AFTER or None,
+)
+
+# state of the startup connection, see connect()
+connection_status = {
+    "agent": ZEREPY_AGENT,
+    "loaded": False,
+    "attempts": 0,
+    "error": None,
+}
+
+# (address, token) => get-balance response
+balance_cache = TTLCache(maxsize=BALANCE_CACHE_SIZE, ttl=BALANCE_CACHE_TTL)
+# address => number of invalidations, a read that started before the last
+# one may have seen the pre-transaction balance and is not cached
+balance_generations: Dict[str, int] = {}
+
+
+# actions that change chain state, never coalesced
+WRITE_ACTIONS = {"transfer-custom", "custom-transfer", "custom-swap"}
+
+# (connection, action, params) => task of the upstream read in flight
+inflight: Dict[Hashable, asyncio.Task] = {}
+single_flight_stats = {"upstream": 0, "shared": 0}
+
+
+def _forget_inflight(key: Hashable, task: asyncio.Task):
+    if inflight.get(key) is task:
+        del inflight[key]
+    # nobody may be left to await a failed call
+    if not task.cancelled():
+        task.exception()
+
+
+async def async_read_action(
+    connection: str, action: str, params: List, generation: int = 0
+):
+    """perform_action for reads, concurrent identical calls share one request.
+
+    The upstream call runs in its own task so a caller that gives up (a
+    timeout, a closed request) does not fail the others waiting on it.
+    Calls only share a request started under the same `generation`.
+    """
+    if action in WRITE_ACTIONS:
+        raise ValueError(f"{action} is a write action and must not be coalesced")
+
+    key = (connection, action, tuple(params), generation)
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(
+            async_client.perform_action(
+                connection=connection, action=action, params=params
+            )
+        )
+        inflight[key] = task
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+        single_flight_stats["upstream"] += 1
+    else:
+        single_flight_stats["shared"] += 1
+    return await asyncio.shield(task)
 
-client = ZerePyClient("http://localhost:8000")
+
+def _balance_key(address: str, token_address: Optional[str]):
+    return (address.lower(), (token_address or "").lower())
+
+
+def balance_generation(address: str) -> int:
+    return balance_generations.get(address.lower(), 0)
+
+
+def invalidate_balances(address: Optional[str]):
+    """Drop every cached balance of an address, reads in flight are not cached"""
+    if not address:
+        return 0
+    address = address.lower()
+    balance_generations[address] = balance_generations.get(address, 0) + 1
+    return balance_cache.invalidate(lambda key: key[0] == address)
+
+
+async def connect():
+    """Load the ZerePy agent and open pooled connections.
+
+    Runs in the background from the app lifespan and retries with backoff
+    until ZerePy is up, the app is not ready before it succeeds.
+    """
+    delay = 0.5
+    while True:
+        connection_status["attempts"] += 1
+        try:
+            await async_client.load_agent(ZEREPY_AGENT)
+            await asyncio.gather(
+                *(async_client.get_status() for _ in range(ZEREPY_PREWARM_CONNECTIONS))
+            )
+            connection_status.update(loaded=True, error=None)
+            return
+        except ZerePyError as e:
+            connection_status["error"] = str(e)
+            logger.warning("ZerePy not ready, retrying in %ss: %s", delay, e)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, ZEREPY_CONNECT_RETRY_MAX)
 
 
 def get_address():
@@ -32,18 +176,17 @@ def get_address():
         connection="evm",
         action="get-address",
     )
-    print(res)
+    logger.debug("get-address %s", res)
     return res
 
 
 def get_balance(address: str, token_address: Optional[str] = None):
-    print("get_balance", token_address)
     res = client.perform_action(
         connection="sonic",
         action="get-balance",
         params=[address, token_address],
     )
-    print(res)
+    logger.info("balance %s of %s", token_address, address, extra=sampled())
     return res
 
 
@@ -55,7 +198,7 @@ def transfer_custom(
         action="transfer-custom",
         params=[to_address, amount, private_key, token_address],
     )
-    print(res)
+    logger.info("transfer-custom %s %s to %s", amount, token_address, to_address)
     return res
 
 
@@ -67,7 +210,7 @@ def transfer_sonic_custom(
         action="custom-transfer",
         params=[to_address, amount, private_key, token_address],
     )
-    print(res)
+    logger.info("custom-transfer %s %s to %s", amount, token_address, to_address)
     return res
 
 
@@ -78,20 +221,102 @@ def sonic_custom_swap(
     private_key: str,
     slippage: str = "0.5",
 ):
-    print("sonic_custom_swap", token_in, token_out, amount, private_key, slippage)
     res = client.perform_action(
         connection="sonic",
         action="custom-swap",
         params=[token_in, token_out, amount, private_key, slippage],
     )
-    print(res)
+    logger.info("custom-swap %s %s to %s, slippage %s", amount, token_in, token_out, slippage)
     return res
 
 
-client.load_agent("etheth")
+async def async_get_balance(address: str, token_address: Optional[str] = None):
+    key = _balance_key(address, token_address)
+    res = balance_cache.get(key)
+    if res is not None:
+        return res
+
+    generation = balance_generation(address)
+    res = await async_read_action(
+        connection="sonic",
+        action="get-balance",
+        params=[address, token_address],
+        generation=generation,
+    )
+    logger.debug("balance %s of %s", token_address, address, extra=sampled())
+    if balance_generation(address) == generation:
+        balance_cache.set(key, res)
+    return res
+
+
+async def async_get_balances(
+    address: str,
+    token_addresses: List[str],
+    concurrency: int = PORTFOLIO_CONCURRENCY,
+    timeout: float = PORTFOLIO_TOKEN_TIMEOUT,
+) -> Dict[str, dict]:
+    """Fetch the balance of many tokens concurrently.
+
+    At most `concurrency` lookups are in flight and each one gets `timeout`
+    seconds. A failing token gets an `error` entry instead of failing the
+    whole portfolio. A lookup that timed out keeps its slot until the
+    upstream request finishes, so slow upstreams never see more than
+    `concurrency` requests from one portfolio.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def release(task: asyncio.Task):
+        semaphore.release()
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(token_address: str) -> dict:
+        await semaphore.acquire()
+        task = asyncio.ensure_future(async_get_balance(address, token_address))
+        task.add_done_callback(release)
+        try:
+            res = await asyncio.wait_for(asyncio.shield(task), timeout)
+            return {"balance": res["result"]}
+        except asyncio.TimeoutError:
+            return {"error": f"Timed out after {timeout}s"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    tokens = list(dict.fromkeys(token_addresses))
+    results = await asyncio.gather(*(fetch(token) for token in tokens))
+    return dict(zip(tokens, results))
+
+
+async def async_transfer_sonic_custom(
+    to_address: str, amount: str, private_key: str, token_address: Optional[str] = None
+):
+    res = await async_client.perform_action(
+        connection="sonic",
+        action="custom-transfer",
+        params=[to_address, amount, private_key, token_address],
+    )
+    logger.info("custom-transfer %s %s to %s", amount, token_address, to_address)
+    return res
+
+
+async def async_sonic_custom_swap(
+    token_in: str,
+    token_out: str,
+    amount: str,
+    private_key: str,
+    slippage: str = "0.5",
+):
+    res = await async_client.perform_action(
+        connection="sonic",
+        action="custom-swap",
+        params=[token_in, token_out, amount, private_key, slippage],
+    )
+    logger.info("custom-swap %s %s to %s, slippage %s", amount, token_in, token_out, slippage)
+    return res
 
 
 if __name__ == "__main__":
+    client.load_agent(ZEREPY_AGENT)
     print("transfer-custom")
     res = client.perform_action(
         connection="evm",
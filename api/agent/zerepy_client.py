@@ -1,20 +1,173 @@
+import time
+import random
+import asyncio
+import httpx
 import requests
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
+
+from api.metrics import zerepy_action_seconds, zerepy_action_errors, observe_since
+
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (3.0, 30.0)
+
+# Per-action (connect, read) timeouts. Reads should fail fast, transactions
+# have to wait for broadcast and confirmation on chain.
+ACTION_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "get-address": (3.0, 10.0),
+    "get-balance": (3.0, 10.0),
+    "transfer-custom": (3.0, 120.0),
+    "custom-transfer": (3.0, 120.0),
+    "custom-swap": (3.0, 120.0),
+}
+
+# idempotent actions, safe to retry and hedge
+READ_ACTIONS = {"get-address", "get-balance"}
+# reads worth a second request when slow, see AsyncZerePyClient.hedge_after
+HEDGED_ACTIONS = {"get-balance"}
+
+
+class ZerePyError(Exception):
+    """A failed ZerePy call.
+
+    ``kind`` is "timeout", "connect", "http" (``status_code`` is set),
+    "invalid_response" or "circuit_open" (``retry_after`` is set).
+    ``sent`` is false when the request never reached ZerePy.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        kind: str = "http",
+        status_code: Optional[int] = None,
+        connection: Optional[str] = None,
+        action: Optional[str] = None,
+        retry_after: Optional[float] = None,
+        sent: Optional[bool] = None,
+    ):
+        super().__init__(f"Request failed: {message}")
+        if sent is None:
+            sent = kind not in ("connect", "circuit_open")
+        self.sent = sent
+        self.message = message
+        self.kind = kind
+        self.status_code = status_code
+        self.connection = connection
+        self.action = action
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        if self.kind in ("timeout", "connect"):
+            return True
+        return self.kind == "http" and self.status_code is not None and self.status_code >= 500
+
+    @property
+    def may_have_run(self) -> bool:
+        """The action may have run upstream, a write must not be blindly retried"""
+        if not self.sent:
+            return False
+        if self.kind == "http":
+            return self.status_code is None or self.status_code >= 500
+        return self.kind in ("timeout", "invalid_response")
+
+    @property
+    def http_status(self) -> int:
+        """Status code to answer our own clients with"""
+        if self.kind == "circuit_open":
+            return 503
+        if self.kind == "timeout":
+            return 504
+        return 502
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "error": "zerepy_" + self.kind,
+            "message": self.message,
+            "status_code": self.status_code,
+            "connection": self.connection,
+            "action": self.action,
+            "retry_after": self.retry_after,
+        }
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and fails fast
+    for ``reset_timeout`` seconds, then lets a single probe call through."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self) -> None:
+        """The call was abandoned without an outcome"""
+        self.probing = False
 
 
 class ZerePyClient:
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    ):
         self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
 
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """Make HTTP request with error handling"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        kwargs.setdefault("timeout", self.timeout)
         try:
-            response = requests.request(method, url, **kwargs)
+            response = self.session.request(method, url, **kwargs)
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Request failed: {str(e)}")
+        except requests.exceptions.ConnectTimeout as e:
+            raise ZerePyError(str(e), kind="timeout", sent=False)
+        except requests.exceptions.Timeout as e:
+            raise ZerePyError(str(e), kind="timeout")
+        except requests.exceptions.ConnectionError as e:
+            raise ZerePyError(str(e), kind="connect")
+        except requests.exceptions.HTTPError as e:
+            raise ZerePyError(str(e), status_code=e.response.status_code)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ZerePyError(str(e), kind="invalid_response")
 
     def get_status(self) -> Dict[str, Any]:
         """Get server status"""
@@ -38,7 +191,19 @@ class ZerePyClient:
     ) -> Dict[str, Any]:
         """Execute an agent action"""
         data = {"connection": connection, "action": action, "params": params or []}
-        return self._make_request("POST", "/agent/action", json=data)
+        start = time.perf_counter()
+        try:
+            return self._make_request(
+                "POST",
+                "/agent/action",
+                json=data,
+                timeout=ACTION_TIMEOUTS.get(action, self.timeout),
+            )
+        except ZerePyError as e:
+            zerepy_action_errors.inc(connection, action, e.kind)
+            raise
+        finally:
+            observe_since(zerepy_action_seconds, start, connection, action)
 
     def start_agent(self) -> Dict[str, Any]:
         """Start the agent loop"""
@@ -49,6 +214,227 @@ class ZerePyClient:
         return self._make_request("POST", "/agent/stop")
 
 
+class AsyncZerePyClient:
+    """Async ZerePy client with a keep-alive connection pool.
+
+    At most ``max_concurrency`` requests are in flight at once, further calls
+    wait for a free slot instead of opening new connections.
+
+    Actions fail fast while the circuit breaker of their connection is open.
+    Read actions are retried ``retries`` times with full-jitter exponential
+    backoff, and when ``hedge_after`` is set a second request is sent for a
+    get-balance still running after that many seconds. Writes are never retried.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        action_timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        max_concurrency: int = 20,
+        retries: int = 2,
+        backoff_base: float = 0.1,
+        backoff_max: float = 2.0,
+        breaker_failures: int = 5,
+        breaker_reset: float = 30.0,
+        hedge_after: Optional[float] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.action_timeouts = {**ACTION_TIMEOUTS, **(action_timeouts or {})}
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.hedge_after = hedge_after
+        # connection name => CircuitBreaker
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.counters = {"retries": 0, "hedged": 0, "hedge_wins": 0, "rejected": 0}
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self._timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def _timeout(timeout: Tuple[float, float]) -> httpx.Timeout:
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+
+    async def _make_request(
+        self,
+        method: str,
+        endpoint: str,
+        timeout: Optional[Tuple[float, float]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Make HTTP request with error handling"""
+        if timeout is not None:
+            kwargs["timeout"] = self._timeout(timeout)
+        try:
+            async with self.semaphore:
+                response = await self.client.request(
+                    method, f"/{endpoint.lstrip('/')}", **kwargs
+                )
+            response.raise_for_status()
+            return response.json()
+        except (httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            raise ZerePyError(str(e) or "timed out", kind="timeout", sent=False)
+        except httpx.TimeoutException as e:
+            raise ZerePyError(str(e) or "timed out", kind="timeout")
+        except httpx.TransportError as e:
+            raise ZerePyError(str(e) or "connection failed", kind="connect")
+        except httpx.HTTPStatusError as e:
+            raise ZerePyError(str(e), status_code=e.response.status_code)
+        except (httpx.HTTPError, ValueError) as e:
+            raise ZerePyError(str(e), kind="invalid_response")
+
+    def breaker(self, connection: str) -> CircuitBreaker:
+        breaker = self.breakers.get(connection)
+        if breaker is None:
+            breaker = self.breakers[connection] = CircuitBreaker(
+                self.breaker_failures, self.breaker_reset
+            )
+        return breaker
+
+    async def _call(self, connection: str, action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """One request to /agent/action, guarded by the connection's breaker"""
+        breaker = self.breaker(connection)
+        if not breaker.allow():
+            self.counters["rejected"] += 1
+            raise ZerePyError(
+                f"circuit open for {connection}",
+                kind="circuit_open",
+                connection=connection,
+                action=action,
+                retry_after=round(breaker.retry_after(), 1),
+            )
+        try:
+            result = await self._make_request(
+                "POST",
+                "/agent/action",
+                json=data,
+                timeout=self.action_timeouts.get(action, self.timeout),
+            )
+        except ZerePyError as e:
+            e.connection, e.action = connection, action
+            # a 4xx means ZerePy is up and answering
+            if e.retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.record_success()
+        return result
+
+    async def _hedged_call(self, connection: str, action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a second request if the first is still running after hedge_after"""
+        tasks = [asyncio.create_task(self._call(connection, action, data))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                self.counters["hedged"] += 1
+                tasks.append(asyncio.create_task(self._call(connection, action, data)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "breakers": {
+                connection: {"state": breaker.state, "failures": breaker.failures}
+                for connection, breaker in self.breakers.items()
+            },
+        }
+
+    async def get_status(self) -> Dict[str, Any]:
+        """Get server status"""
+        return await self._make_request("GET", "/")
+
+    async def list_agents(self) -> List[str]:
+        """List available agents"""
+        response = await self._make_request("GET", "/agents")
+        return response.get("agents", [])
+
+    async def load_agent(self, agent_name: str) -> Dict[str, Any]:
+        """Load a specific agent"""
+        return await self._make_request("POST", f"/agents/{agent_name}/load")
+
+    async def list_connections(self) -> Dict[str, Any]:
+        """List available connections"""
+        return await self._make_request("GET", "/connections")
+
+    async def perform_action(
+        self, connection: str, action: str, params: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Execute an agent action"""
+        start = time.perf_counter()
+        try:
+            return await self._perform_action(connection, action, params)
+        except ZerePyError as e:
+            zerepy_action_errors.inc(connection, action, e.kind)
+            raise
+        finally:
+            observe_since(zerepy_action_seconds, start, connection, action)
+
+    async def _perform_action(
+        self, connection: str, action: str, params: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        data = {"connection": connection, "action": action, "params": params or []}
+        if action not in READ_ACTIONS:
+            return await self._call(connection, action, data)
+
+        hedge = self.hedge_after and action in HEDGED_ACTIONS
+        call = self._hedged_call if hedge else self._call
+        attempt = 0
+        while True:
+            try:
+                return await call(connection, action, data)
+            except ZerePyError as e:
+                if not e.retryable or attempt >= self.retries:
+                    raise
+            self.counters["retries"] += 1
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+
+    async def start_agent(self) -> Dict[str, Any]:
+        """Start the agent loop"""
+        return await self._make_request("POST", "/agent/start")
+
+    async def stop_agent(self) -> Dict[str, Any]:
+        """Stop the agent loop"""
+        return await self._make_request("POST", "/agent/stop")
+
+    async def aclose(self) -> None:
+        """Close the pooled connections"""
+        await self.client.aclose()
+
+
 class ZerepyResponse:
     status: str
     result: int | float | str
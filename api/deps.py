@@ -1,41 +1,103 @@
 from typing import Annotated
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from dotenv import load_dotenv
 import os
-from .database import SessionLocal
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .database import SessionLocal, AsyncSessionLocal
+from .cache import TTLCache
+from .metrics import db_session_seconds, observe_since
 
 load_dotenv()
 
 SECRET_KEY = os.getenv('AUTH_SECRET_KEY')
 ALGORITHM = os.getenv('AUTH_ALGORITHM')
+TOKEN_CACHE_ENABLED = os.getenv('AUTH_TOKEN_CACHE', '1') == '1'
+TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '10000'))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', '32'))
 
 def get_db():
+    start = time.perf_counter()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
-        
+        observe_since(db_session_seconds, start, 'sync')
+
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
+
+async def get_async_db():
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        yield db
+    observe_since(db_session_seconds, start, 'async')
+
+
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+
 bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+# bcrypt releases the GIL, so hashing runs on a few dedicated threads instead
+# of the event loop. Once PASSWORD_HASH_QUEUE calls are waiting we answer 503.
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='bcrypt')
+password_jobs = 0
+
+
+async def run_password_job(fn, *args):
+    global password_jobs
+    if password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many authentication requests, try again later',
+            headers={'Retry-After': '1'},
+        )
+    password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, fn, *args)
+    finally:
+        password_jobs -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await run_password_job(bcrypt_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await run_password_job(bcrypt_context.verify, password, hashed_password)
+
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
 oauth2_bearer_dependency = Annotated[str, Depends(oauth2_bearer)]
 
+# verified token => claims, every entry expires with the token's exp
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+
 
 async def get_current_user(token: oauth2_bearer_dependency):
+    if TOKEN_CACHE_ENABLED:
+        claims = token_cache.get(token)
+        if claims is not None:
+            return dict(claims)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get('sub')
         user_id: int = payload.get('id')
         if username is None or user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not1 validate user')
-        return {'username': username, 'id': user_id}
+        claims = {'username': username, 'id': user_id}
+        exp = payload.get('exp')
+        if TOKEN_CACHE_ENABLED and exp is not None:
+            token_cache.set(token, claims, ttl=exp - time.time())
+        return dict(claims)
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not2 validate user')
     
@@ -0,0 +1,328 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update
+from sqlalchemy.orm import load_only
+
+from api.database import AsyncSessionLocal
+from api.models import AIAgent, TransactionJob
+from api.agent.agent import (
+    Action,
+    AgentResponse,
+    SwapResponse,
+    WithdrawResponse,
+    async_execute_transaction,
+)
+from api.agent.wallet import evm_address_from_key
+from api.agent.zerepy import invalidate_balances
+from api.agent.zerepy_client import READ_ACTIONS, ZerePyError
+from api.metrics import transaction_jobs
+from api.log import request_id
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# transactions of a wallet run one at a time, wallets run in parallel
+JOB_MAX_PARALLEL = int(os.getenv("JOB_MAX_PARALLEL", "32"))
+JOB_LANE_DEPTH = int(os.getenv("JOB_LANE_DEPTH", "16"))
+JOB_LANE_RETRY_AFTER = int(os.getenv("JOB_LANE_RETRY_AFTER", "5"))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# was running when the process stopped, or ZerePy failed after the request
+# was sent: the transaction may or may not have been broadcast so it is
+# never retried automatically
+INTERRUPTED = "interrupted"
+UNCERTAIN_ERROR = "check the wallet before retrying"
+FINISHED = (SUCCEEDED, FAILED, INTERRUPTED)
+
+DATA_MODELS = {
+    Action.SWAP: SwapResponse,
+    Action.WITHDRAW: WithdrawResponse,
+}
+
+# wallet address => Lane, a lane exists while it has pending jobs
+lanes: Dict[str, "Lane"] = {}
+# lane tasks in the middle of a job
+busy = set()
+stopping = False
+parallel: Optional[asyncio.Semaphore] = None
+# set once ZerePy is reachable, lanes hold their jobs until then
+zerepy_ready = asyncio.Event()
+
+lane_metrics = {
+    "submitted": 0,
+    "rejected": 0,
+    "started": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+# job id => events set on every status change of the job
+watchers: Dict[int, List[asyncio.Event]] = {}
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def watch(job_id: int) -> asyncio.Event:
+    event = asyncio.Event()
+    watchers.setdefault(job_id, []).append(event)
+    return event
+
+
+def unwatch(job_id: int, event: asyncio.Event):
+    events = watchers.get(job_id, [])
+    if event in events:
+        events.remove(event)
+    if not events:
+        watchers.pop(job_id, None)
+
+
+def notify(job_id: int):
+    for event in watchers.pop(job_id, []):
+        event.set()
+
+
+class Lane:
+    """Pending transactions of one wallet, run strictly in submission order"""
+
+    def __init__(self, address: str):
+        self.address = address
+        # (job id, monotonic enqueue time, id of the request that queued it)
+        self.pending: "deque[Tuple[int, float, Optional[str]]]" = deque()
+        # accepted requests whose job row is still being written
+        self.reserved = 0
+        self.running: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending) + self.reserved + (self.running is not None)
+
+    def submit(self, job_id: int, enqueued_at: float):
+        self.pending.append((job_id, enqueued_at, request_id.get()))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        await zerepy_ready.wait()
+        while self.pending and not stopping:
+            job_id, enqueued_at, job_request_id = self.pending.popleft()
+            # the task was started by whichever request came first
+            request_id.set(job_request_id)
+            async with parallel:
+                record_wait(time.monotonic() - enqueued_at)
+                self.running = job_id
+                busy.add(self.task)
+                try:
+                    await run_job(job_id)
+                except Exception:
+                    logger.exception("job %s crashed", job_id)
+                finally:
+                    busy.discard(self.task)
+                    self.running = None
+        if not self.pending and not self.reserved:
+            lanes.pop(self.address, None)
+
+
+def lane_key(address: Optional[str]) -> str:
+    return (address or "").lower()
+
+
+def get_lane(address: Optional[str]) -> Lane:
+    key = lane_key(address)
+    lane = lanes.get(key)
+    if lane is None:
+        lane = lanes[key] = Lane(key)
+    return lane
+
+
+def record_wait(seconds: float):
+    lane_metrics["started"] += 1
+    lane_metrics["wait_seconds_total"] += seconds
+    lane_metrics["wait_seconds_max"] = max(lane_metrics["wait_seconds_max"], seconds)
+
+
+def lane_stats():
+    now_monotonic = time.monotonic()
+    started = lane_metrics["started"]
+    return {
+        "lanes": len(lanes),
+        "running": len(busy),
+        "queued": sum(len(lane.pending) for lane in lanes.values()),
+        "depth_max": max((lane.depth for lane in lanes.values()), default=0),
+        "oldest_wait_seconds": max(
+            (now_monotonic - lane.pending[0][1] for lane in lanes.values() if lane.pending),
+            default=0.0,
+        ),
+        "wait_seconds_avg": lane_metrics["wait_seconds_total"] / started if started else 0.0,
+        "lane_depth_limit": JOB_LANE_DEPTH,
+        "max_parallel": JOB_MAX_PARALLEL,
+        **lane_metrics,
+    }
+
+
+async def enqueue_job(
+    user_id: int, agent_id: int, address: Optional[str], response: AgentResponse
+) -> TransactionJob:
+    """Persist a transaction and queue it in the lane of its wallet.
+
+    Raises 429 when the wallet already has JOB_LANE_DEPTH pending jobs.
+    """
+    lane = get_lane(address)
+    if lane.depth >= JOB_LANE_DEPTH:
+        lane_metrics["rejected"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many pending transactions for this wallet",
+            headers={"Retry-After": str(JOB_LANE_RETRY_AFTER)},
+        )
+
+    # holds the slot, and keeps the lane alive, while the row is written
+    lane.reserved += 1
+    try:
+        async with AsyncSessionLocal() as db:
+            job = TransactionJob(
+                user_id=user_id,
+                agent_id=agent_id,
+                action=response.action.value,
+                request=jsonable_encoder(response.data),
+                status=QUEUED,
+            )
+            db.add(job)
+            await db.commit()
+    except Exception:
+        lane.reserved -= 1
+        if not lane.depth:
+            lanes.pop(lane.address, None)
+        raise
+    lane.reserved -= 1
+    lane.submit(job.id, time.monotonic())
+    lane_metrics["submitted"] += 1
+    return job
+
+
+async def get_job(db, job_id: int, user_id: int) -> Optional[TransactionJob]:
+    return await db.scalar(
+        select(TransactionJob).where(
+            TransactionJob.id == job_id, TransactionJob.user_id == user_id
+        )
+    )
+
+
+async def run_job(job_id: int):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(TransactionJob, job_id)
+        if job is None or job.status != QUEUED:
+            return
+        agent = await db.scalar(
+            select(AIAgent)
+            .options(load_only(AIAgent.evm_address, AIAgent.evm_private_key))
+            .where(AIAgent.id == job.agent_id)
+        )
+        job.status = RUNNING
+        job.started_at = now()
+        await db.commit()
+        notify(job_id)
+
+        try:
+            if agent is None:
+                raise ValueError("AIAgent not found")
+            action = Action(job.action)
+            response = AgentResponse(
+                success=True, action=action, data=DATA_MODELS[action](**job.request)
+            )
+            address = agent.evm_address or evm_address_from_key(agent.evm_private_key)
+            job.result = await async_execute_transaction(
+                response, private_key=agent.evm_private_key, address=address
+            )
+            job.status = SUCCEEDED
+        except ZerePyError as e:
+            # a write that timed out or failed upstream may still have been broadcast
+            if e.may_have_run and e.action not in READ_ACTIONS:
+                job.status = INTERRUPTED
+                job.error = f"{e}, {UNCERTAIN_ERROR}"
+                invalidate_balances(address)
+            else:
+                job.status = FAILED
+                job.error = str(e)
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        job.finished_at = now()
+        await db.commit()
+    transaction_jobs.inc(job.action, job.status)
+    logger.info("job %s %s %s", job_id, job.action, job.status)
+    notify(job_id)
+
+
+async def resume_jobs() -> List[Tuple[int, Optional[str]]]:
+    """Mark jobs cut off by a restart as interrupted, return the queued ones
+    with their wallet address"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(TransactionJob)
+            .where(TransactionJob.status == RUNNING)
+            .values(
+                status=INTERRUPTED,
+                error=f"Interrupted by a restart, {UNCERTAIN_ERROR}",
+                finished_at=now(),
+            )
+        )
+        rows = await db.execute(
+            select(TransactionJob.id, AIAgent.evm_address, AIAgent.evm_private_key)
+            .outerjoin(AIAgent, AIAgent.id == TransactionJob.agent_id)
+            .where(TransactionJob.status == QUEUED)
+            .order_by(TransactionJob.id)
+        )
+        queued = [
+            (row.id, row.evm_address or evm_address_from_key(row.evm_private_key))
+            for row in rows
+        ]
+        await db.commit()
+    return queued
+
+
+async def start_workers():
+    """Recover the job table and queue the jobs found in it, ahead of any
+    new request. Lanes start running once set_zerepy_ready() is called."""
+    global parallel, stopping, zerepy_ready
+    stopping = False
+    parallel = asyncio.Semaphore(JOB_MAX_PARALLEL)
+    zerepy_ready = asyncio.Event()
+    lanes.clear()
+    for job_id, address in await resume_jobs():
+        get_lane(address).submit(job_id, time.monotonic())
+
+
+def set_zerepy_ready():
+    zerepy_ready.set()
+
+
+async def stop_workers():
+    """Let running jobs finish, queued jobs stay in the table for the next start"""
+    global stopping
+    stopping = True
+    tasks = [lane.task for lane in lanes.values() if lane.task is not None]
+    for task in tasks:
+        if task not in busy:
+            task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=JOB_SHUTDOWN_TIMEOUT)
+    for task in tasks:
+        task.cancel()
+    lanes.clear()
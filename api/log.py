@@ -0,0 +1,189 @@
+import os
+import re
+import sys
+import json
+import uuid
+import queue
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# LOG_LEVEL applies to these, libraries only log warnings
+APP_LOGGERS = ("api", "main")
+# fraction of high-volume events that are kept, see sampled()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_REDACT = os.getenv("LOG_REDACT", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+SECRET_KEYS = re.compile(
+    r"(private_key|secret|password|api_key|access_token|mnemonic|authorization)", re.IGNORECASE
+)
+# 32 byte hex strings, i.e. EVM private keys
+SECRET_VALUES = re.compile(r"\b(0x)?[0-9a-fA-F]{64}\b")
+REDACTED = "[redacted]"
+
+# attributes every LogRecord has, everything else came in through extra=
+RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+    "request_id",
+    "sample_rate",
+}
+
+
+def redact(value: Any, key: str = "") -> Any:
+    if key and SECRET_KEYS.search(key):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and len(value) >= 64:
+        return SECRET_VALUES.sub(REDACTED, value)
+    return value
+
+
+def sampled(rate: float = LOG_SAMPLE_RATE) -> dict:
+    """extra= for high-volume events, only `rate` of them are written"""
+    return {"sample_rate": rate}
+
+
+class ContextFilter(logging.Filter):
+    """Runs in the caller, where the request id contextvar is visible, and
+    drops sampled out records before they are queued"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is not None and random.random() >= rate:
+            return False
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        msg = record.getMessage()
+        extra = {key: value for key, value in record.__dict__.items() if key not in RESERVED}
+        if record.exc_info:
+            extra["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            extra["exc"] = record.exc_text
+        if LOG_REDACT:
+            msg = redact(msg)
+            extra = redact(extra)
+        return json.dumps(
+            {
+                "ts": round(record.created, 6),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": msg,
+                "request_id": getattr(record, "request_id", None),
+                **extra,
+            },
+            default=str,
+        )
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands the record over as is, the listener thread formats and writes it.
+
+    The stdlib handler formats in the calling thread, which is exactly the
+    work we want off the request path. Full queue drops instead of blocking.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args are formatted later, in another thread, so callers only pass
+        # ids, numbers and short strings. Tracebacks can't wait.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            QueueHandler.dropped += 1
+
+
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # waits for room, the stdlib one raises queue.Full when the writer is behind
+        self.queue.put(self._sentinel)
+
+
+listener: Optional[QueueListener] = None
+
+
+def setup_logging(stream=None) -> None:
+    """Route every log record through a queue to a background writer thread"""
+    global listener
+    if listener is not None:
+        return
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = QueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(logging.WARNING)
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(LOG_LEVEL)
+
+
+def shutdown_logging() -> None:
+    """Flush what is queued and stop the writer thread"""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware, takes X-Request-ID from the client or makes one
+    and returns it on the response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                current = value.decode("latin-1")[:64]
+                break
+        current = current or uuid.uuid4().hex
+        token = request_id.set(current)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(
+                    (REQUEST_ID_HEADER.encode(), current.encode("latin-1"))
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
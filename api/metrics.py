@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# per-route request histograms and the /metrics endpoint
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# seconds, from a fast cache hit to a slow chain transaction
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # one uncontended lock per metric, held for a few dict/list operations
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in values
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels => [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        lines = self.header()
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Read at scrape time from ``callback``, which returns {labels: value}"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        labelnames: Iterable[str] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {value}"
+            for labels, value in values.items()
+        ]
+
+
+registry: List[Metric] = []
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the last response byte, per route",
+    ("method", "route", "status"),
+)
+llm_request_seconds = Histogram(
+    "llm_request_duration_seconds",
+    "Latency of structured OpenAI calls",
+    ("model", "mode"),
+)
+llm_tokens = Counter(
+    "llm_tokens_total",
+    "Tokens reported by OpenAI, type is prompt, completion or cached",
+    ("model", "type"),
+)
+zerepy_action_seconds = Histogram(
+    "zerepy_action_duration_seconds",
+    "Latency of ZerePy perform_action calls, retries included",
+    ("connection", "action"),
+)
+zerepy_action_errors = Counter(
+    "zerepy_action_errors_total",
+    "Failed ZerePy perform_action calls",
+    ("connection", "action", "kind"),
+)
+agent_actions = Counter(
+    "agent_actions_total",
+    "Outcome of the agent's answers, per action and status",
+    ("action", "status"),
+)
+transaction_jobs = Counter(
+    "transaction_jobs_total",
+    "Finished transaction jobs, per action and final status",
+    ("action", "status"),
+)
+db_session_seconds = Histogram(
+    "db_session_duration_seconds",
+    "Time a request holds a database session",
+    ("kind",),
+)
+loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop runs a timer, sampled every METRICS_LOOP_LAG_INTERVAL",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+last_loop_lag = {"seconds": 0.0}
+Gauge(
+    "event_loop_lag_last_seconds",
+    "Most recent event loop lag sample",
+    lambda: {(): last_loop_lag["seconds"]},
+)
+
+
+def threadpool_usage() -> Dict[LabelValues, float]:
+    from anyio.to_thread import current_default_thread_limiter
+    from api import deps
+
+    limiter = current_default_thread_limiter()
+    return {
+        ("anyio", "busy"): limiter.borrowed_tokens,
+        ("anyio", "size"): limiter.total_tokens,
+        ("bcrypt", "busy"): deps.password_jobs,
+        ("bcrypt", "size"): deps.PASSWORD_HASH_WORKERS,
+    }
+
+
+Gauge(
+    "threadpool_threads",
+    "Threads in use (busy, bcrypt includes queued jobs) and pool size",
+    threadpool_usage,
+    ("pool", "state"),
+)
+
+
+async def sample_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Runs for the app's lifetime, see main.py"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        last_loop_lag["seconds"] = lag
+        loop_lag_seconds.observe(lag)
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware, labels requests with the route template so
+    /aiagents/1 and /aiagents/2 land in the same series"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status["code"]),
+            )
+
+
+def observe_since(histogram: Histogram, start: float, *labels: str) -> None:
+    histogram.observe(time.perf_counter() - start, *labels)
@@ -0,0 +1,81 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from .database import Base
+from .models import AIAgent
+from .agent.wallet import evm_address_from_key
+
+
+def ensure_schema(engine: Engine):
+    """Add the columns and indexes that create_all skips on existing tables"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    default = getattr(column.server_default.arg, "text", column.server_default.arg)
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def ensure_autoincrement(engine: Engine):
+    """Rebuild SQLite tables created before they were declared AUTOINCREMENT"""
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not table.dialect_options["sqlite"]["autoincrement"] or not inspector.has_table(table.name):
+            continue
+        with engine.connect() as conn:
+            ddl = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+            ).scalar()
+            foreign_keys = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+            conn.commit()
+            if "AUTOINCREMENT" in ddl.upper():
+                continue
+            # https://www.sqlite.org/lang_altertable.html#otheralter
+            columns = ", ".join(column["name"] for column in inspector.get_columns(table.name))
+            rebuilt = f"{table.name}_rebuild"
+            create = str(CreateTable(table).compile(engine)).replace(
+                f"CREATE TABLE {table.name} ", f"CREATE TABLE {rebuilt} ", 1
+            )
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.exec_driver_sql(create)
+            conn.exec_driver_sql(f"INSERT INTO {rebuilt} ({columns}) SELECT {columns} FROM {table.name}")
+            conn.exec_driver_sql(f"DROP TABLE {table.name}")
+            conn.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {table.name}")
+            for index in table.indexes:
+                index.create(conn)
+            conn.commit()
+            conn.exec_driver_sql(f"PRAGMA foreign_keys={foreign_keys}")
+            conn.commit()
+
+
+def backfill_evm_addresses(engine: Engine):
+    """Store the derived address of agents created before evm_address existed"""
+    with Session(engine) as session:
+        agents = (
+            session.query(AIAgent)
+            .filter(AIAgent.evm_address.is_(None), AIAgent.evm_private_key.isnot(None))
+            .all()
+        )
+        for agent in agents:
+            agent.evm_address = evm_address_from_key(agent.evm_private_key)
+        session.commit()
+
+
+def migrate(engine: Engine):
+    ensure_schema(engine)
+    ensure_autoincrement(engine)
+    backfill_evm_addresses(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.mutable import MutableList
 from sqlalchemy import JSON
@@ -12,13 +12,16 @@ class User(Base):
 
 class AIAgent(Base):
     __tablename__ = 'aiagents'
+    # never reuse the id of a deleted agent, the ETags are built from id and version
+    __table_args__ = {'sqlite_autoincrement': True}
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     agent_name = Column(String, nullable=False)
     agent_bio = Column(MutableList.as_mutable(JSON), nullable=False)
     agent_twitter = Column(String, nullable=True)
     traits = Column(MutableList.as_mutable(JSON), nullable=False)
     evm_private_key = Column(String, nullable=True)
+    evm_address = Column(String, nullable=True, index=True)
     solana_private_key = Column(String, nullable=True)
     sonic_private_key = Column(String, nullable=True)
     goat_rpc_provider_url = Column(String, nullable=True)
@@ -43,12 +46,17 @@ class AIAgent(Base):
     galadriel_fine_tune_api_key = Column(String, nullable=True)
     eternalai_api_key = Column(String, nullable=True)
     eternalai_api_url = Column(String, nullable=True)
+    # bumped on every update, used as the ETag of the agent
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     user = relationship("User", back_populates="aiagents")
     conversations = relationship("Conversation", back_populates="agent", cascade="all, delete-orphan")
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_agent_id_user_id_id", "agent_id", "user_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     agent_id = Column(Integer, ForeignKey("aiagents.id"), nullable=False)
@@ -56,10 +64,13 @@ class Conversation(Base):
 
     user = relationship("User", back_populates="conversations")
     agent = relationship("AIAgent", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.id")
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)
@@ -68,5 +79,24 @@ class Message(Base):
 
     conversation = relationship("Conversation", back_populates="messages")
 
+class TransactionJob(Base):
+    """A swap or withdraw that runs in the background, see api/jobs.py"""
+    __tablename__ = "transaction_jobs"
+    __table_args__ = (
+        Index("ix_transaction_jobs_status_id", "status", "id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    agent_id = Column(Integer, ForeignKey("aiagents.id"), nullable=False)
+    action = Column(String, nullable=False)
+    # the AgentResponse to execute, the private key is read from the agent
+    request = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="queued", server_default="queued")
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 User.aiagents = relationship("AIAgent", back_populates="user")
 User.conversations = relationship("Conversation", back_populates="user")
\ No newline at end of file
@@ -1,10 +1,18 @@
+import zlib
 from pydantic import BaseModel
 from typing import List, Optional
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from datetime import datetime
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased, load_only, selectinload
 
 from api.models import AIAgent, Conversation, Message
 from api.deps import db_dependency, user_dependency
+from api.agent.wallet import evm_address_from_key
+from api.agent.prompt import invalidate_system_prompt
+from api.agent.chat_cache import invalidate_chat_cache
 
 router = APIRouter(prefix="/aiagents", tags=["aiagents"])
 
@@ -55,10 +63,22 @@ class AIAgentUpdate(AIAgentBase):
 
 class AIAgentResponse(AIAgentBase):
     id: int
+    evm_address: Optional[str] = None
 
     class Config:
         orm_mode = True
 
+class AIAgentSummaryResponse(BaseModel):
+    id: int
+    agent_name: str
+    agent_bio: List[str]
+
+    class Config:
+        orm_mode = True
+
+
+AIAGENT_FIELDS = list(AIAgentResponse.__fields__)
+
 class MessageBase(BaseModel):
     role: str
     content: str
@@ -87,6 +107,37 @@ class ConversationResponse(ConversationBase):
     class Config:
         orm_mode = True
 
+class ConversationSummaryResponse(ConversationBase):
+    id: int
+    created_at: datetime
+    message_count: int
+    last_message: Optional[MessageResponse] = None
+
+
+def paginate(query, column, limit: int, before: Optional[int], after: Optional[int]):
+    """Keyset pagination on an increasing id column.
+
+    Without `after` the newest `limit` rows (older than `before`) are
+    returned, with `after` the oldest rows following it. Either way the
+    page is ordered oldest first; ids follow created_at, so this is also
+    creation order.
+    """
+    if before is not None:
+        query = query.filter(column < before)
+    if after is not None:
+        return query.filter(column > after).order_by(column.asc()).limit(limit).all()
+    rows = query.order_by(column.desc()).limit(limit).all()
+    rows.reverse()
+    return rows
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
 
 @router.get("/", response_model=List[AIAgentResponse])
 def get_aiagents(db: db_dependency, user: user_dependency):
@@ -94,24 +145,79 @@ def get_aiagents(db: db_dependency, user: user_dependency):
     return db.query(AIAgent).filter(AIAgent.user_id == user["id"]).all()
 
 
+@router.get("/summary", response_model=List[AIAgentSummaryResponse])
+def get_aiagent_summaries(db: db_dependency, user: user_dependency, request: Request):
+    # count, id and version sums change on every create, delete and update
+    count, id_sum, version_sum = db.query(
+        func.count(AIAgent.id),
+        func.coalesce(func.sum(AIAgent.id), 0),
+        func.coalesce(func.sum(AIAgent.version), 0),
+    ).filter(AIAgent.user_id == user["id"]).one()
+    etag = f'W/"{count}-{id_sum}-{version_sum}"'
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    agents = (
+        db.query(AIAgent)
+        .options(load_only(AIAgent.id, AIAgent.agent_name, AIAgent.agent_bio))
+        .filter(AIAgent.user_id == user["id"])
+        .order_by(AIAgent.id)
+        .all()
+    )
+    content = [
+        {"id": agent.id, "agent_name": agent.agent_name, "agent_bio": agent.agent_bio}
+        for agent in agents
+    ]
+    return JSONResponse(content=jsonable_encoder(content), headers={"ETag": etag})
+
+
 @router.get("/{aiagent_id}", response_model=AIAgentResponse)
-def get_aiagent(db: db_dependency, user: user_dependency, aiagent_id: int):
+def get_aiagent(
+    db: db_dependency,
+    user: user_dependency,
+    request: Request,
+    aiagent_id: int,
+    fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+):
+    selected = AIAGENT_FIELDS
+    if fields:
+        selected = list(dict.fromkeys(["id", *(field.strip() for field in fields.split(",") if field.strip())]))
+        unknown = [field for field in selected if field not in AIAGENT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
     # Filter by both agent ID and user ID to ensure the user owns this agent
-    db_aiagent = (
-        db.query(AIAgent)
+    version = (
+        db.query(AIAgent.version)
         .filter(AIAgent.id == aiagent_id, AIAgent.user_id == user["id"])
-        .first()
+        .scalar()
     )
 
-    if db_aiagent is None:
+    if version is None:
         raise HTTPException(status_code=404, detail="AIAgent not found")
-    return db_aiagent
+
+    etag = f'W/"{aiagent_id}-{version}-{zlib.crc32(",".join(selected).encode()):x}"'
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    db_aiagent = (
+        db.query(AIAgent)
+        .options(load_only(*(getattr(AIAgent, field) for field in selected)))
+        .filter(AIAgent.id == aiagent_id)
+        .first()
+    )
+    content = {field: getattr(db_aiagent, field) for field in selected}
+    return JSONResponse(content=jsonable_encoder(content), headers={"ETag": etag})
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=AIAgentResponse)
 def create_aiagent(db: db_dependency, user: user_dependency, aiagent: AIAgentCreate):
     # Create the agent with the user_id set to the authenticated user
-    db_aiagent = AIAgent(**aiagent.dict(), user_id=user["id"])
+    db_aiagent = AIAgent(
+        **aiagent.dict(),
+        user_id=user["id"],
+        evm_address=evm_address_from_key(aiagent.evm_private_key),
+    )
     db.add(db_aiagent)
     db.commit()
     db.refresh(db_aiagent)
@@ -130,9 +236,13 @@ def update_aiagent(db: db_dependency, user: user_dependency, aiagent_id: int, ai
     
     for key, value in aiagent.dict().items():
         setattr(db_aiagent, key, value)
+    db_aiagent.evm_address = evm_address_from_key(db_aiagent.evm_private_key)
+    db_aiagent.version = (db_aiagent.version or 1) + 1
     
     db.commit()
     db.refresh(db_aiagent)
+    invalidate_system_prompt(aiagent_id)
+    invalidate_chat_cache(aiagent_id)
     return db_aiagent
 
 
@@ -148,6 +258,8 @@ def delete_aiagent(db: db_dependency, user: user_dependency, aiagent_id: int):
     
     db.delete(db_aiagent)
     db.commit()
+    invalidate_system_prompt(aiagent_id)
+    invalidate_chat_cache(aiagent_id)
     return {"ok": True}
 
 @router.post("/{aiagent_id}/conversations", status_code=status.HTTP_201_CREATED, response_model=ConversationResponse)
@@ -171,7 +283,14 @@ def create_conversation(db: db_dependency, user: user_dependency, aiagent_id: in
     return db_conversation
 
 @router.get("/{aiagent_id}/conversations", response_model=List[ConversationResponse])
-def get_conversations(db: db_dependency, user: user_dependency, aiagent_id: int):
+def get_conversations(
+    db: db_dependency,
+    user: user_dependency,
+    aiagent_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+):
     db_aiagent = db.query(AIAgent).filter(
         AIAgent.id == aiagent_id,
         AIAgent.user_id == user['id']
@@ -180,10 +299,62 @@ def get_conversations(db: db_dependency, user: user_dependency, aiagent_id: int)
     if db_aiagent is None:
         raise HTTPException(status_code=404, detail="AIAgent not found")
     
-    return db.query(Conversation).filter(
+    query = db.query(Conversation).options(selectinload(Conversation.messages)).filter(
         Conversation.agent_id == aiagent_id,
         Conversation.user_id == user['id']
-    ).all()
+    )
+    return paginate(query, Conversation.id, limit, before, after)
+
+@router.get("/{aiagent_id}/conversations/summary", response_model=List[ConversationSummaryResponse])
+def get_conversation_summaries(
+    db: db_dependency,
+    user: user_dependency,
+    aiagent_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+):
+    db_aiagent = db.query(AIAgent).filter(
+        AIAgent.id == aiagent_id,
+        AIAgent.user_id == user['id']
+    ).first()
+    
+    if db_aiagent is None:
+        raise HTTPException(status_code=404, detail="AIAgent not found")
+    
+    # count and last message come from correlated subqueries on the
+    # (conversation_id, id) index, all in the same statement
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .scalar_subquery()
+    )
+    last_message_id = (
+        select(func.max(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .scalar_subquery()
+    )
+    last_message = aliased(Message)
+    query = db.query(
+        Conversation.id,
+        Conversation.agent_id,
+        Conversation.created_at,
+        message_count.label("message_count"),
+        last_message,
+    ).outerjoin(last_message, last_message.id == last_message_id).filter(
+        Conversation.agent_id == aiagent_id,
+        Conversation.user_id == user['id']
+    )
+    return [
+        {
+            "id": row.id,
+            "agent_id": row.agent_id,
+            "created_at": row.created_at,
+            "message_count": row.message_count,
+            "last_message": row[4],
+        }
+        for row in paginate(query, Conversation.id, limit, before, after)
+    ]
 
 @router.post("/{aiagent_id}/conversations/{conversation_id}/messages", status_code=status.HTTP_201_CREATED, response_model=MessageResponse)
 def create_message(db: db_dependency, user: user_dependency, aiagent_id: int, conversation_id: int, message: MessageCreate):
@@ -203,7 +374,15 @@ def create_message(db: db_dependency, user: user_dependency, aiagent_id: int, co
     return db_message
 
 @router.get("/{aiagent_id}/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
-def get_messages(db: db_dependency, user: user_dependency, aiagent_id: int, conversation_id: int):
+def get_messages(
+    db: db_dependency,
+    user: user_dependency,
+    aiagent_id: int,
+    conversation_id: int,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+):
     db_conversation = db.query(Conversation).filter(
         Conversation.id == conversation_id,
         Conversation.agent_id == aiagent_id,
@@ -213,6 +392,7 @@ def get_messages(db: db_dependency, user: user_dependency, aiagent_id: int, conv
     if db_conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    return db.query(Message).filter(
+    query = db.query(Message).filter(
         Message.conversation_id == conversation_id
-    ).all()
+    )
+    return paginate(query, Message.id, limit, before, after)
@@ -7,7 +7,7 @@ from jose import jwt
 from dotenv import load_dotenv
 import os
 from api.models import User
-from api.deps import db_dependency, bcrypt_context
+from api.deps import db_dependency, hash_password, verify_password
 
 load_dotenv()
 
@@ -28,11 +28,17 @@ class Token(BaseModel):
     token_type: str
     
     
-def authenticate_user(username: str, password: str, db):
-    user = db.query(User).filter(User.username == username).first()
+async def authenticate_user(username: str, password: str, db):
+    user = (
+        db.query(User.id, User.username, User.hashed_password)
+        .filter(User.username == username)
+        .first()
+    )
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    # give the connection back to the pool before waiting on bcrypt
+    db.close()
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -46,7 +52,7 @@ def create_access_token(username: str, user_id: int, expires_delta: timedelta):
 async def create_user(db: db_dependency, create_user_request: UserCreateRequest):
     create_user_model = User(
         username=create_user_request.username,
-        hashed_password=bcrypt_context.hash(create_user_request.password)
+        hashed_password=await hash_password(create_user_request.password)
     )
     db.add(create_user_model)
     db.commit()
@@ -54,7 +60,7 @@ async def create_user(db: db_dependency, create_user_request: UserCreateRequest)
 @router.post('/token', response_model=Token)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
                                  db: db_dependency):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user")
     token = create_access_token(user.username, user.id, timedelta(minutes=20))
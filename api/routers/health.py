@@ -0,0 +1,69 @@
+import os
+from fastapi import APIRouter, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from api import jobs
+from api.database import AsyncSessionLocal
+from api.agent import zerepy
+from api.routers.zerepy import openai_agent
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+def liveness():
+    """The process is up and the event loop answers"""
+    return {"status": "alive"}
+
+
+async def database_state():
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        return {"ready": True}
+    except Exception as e:
+        return {"ready": False, "error": str(e)}
+
+
+def zerepy_state():
+    open_circuits = [
+        connection
+        for connection, breaker in zerepy.async_client.breakers.items()
+        if breaker.state == "open"
+    ]
+    return {
+        **zerepy.connection_status,
+        "open_circuits": open_circuits,
+        "ready": zerepy.connection_status["loaded"] and not open_circuits,
+    }
+
+
+def openai_state():
+    # a failed warmup is reported but does not take the app out of rotation,
+    # chat requests fail on their own and every other route still works
+    return {
+        "ready": bool(os.getenv("OPENAI_API_KEY")),
+        "warmed_up": openai_agent._client is not None and openai_agent.warmup_error is None,
+        "error": openai_agent.warmup_error,
+    }
+
+
+@router.get("/ready")
+async def readiness(request: Request):
+    """Ready to take traffic, 503 until every dependency is"""
+    dependencies = {
+        "database": await database_state(),
+        "zerepy": zerepy_state(),
+        "openai": openai_state(),
+        "jobs": {"ready": jobs.parallel is not None and not jobs.stopping},
+    }
+    ready = all(dependency["ready"] for dependency in dependencies.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if ready else "starting",
+            "startup": getattr(request.app.state, "startup", None),
+            "dependencies": dependencies,
+        },
+    )
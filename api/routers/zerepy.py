@@ -1,18 +1,55 @@
 import os
+import json
+import asyncio
+import logging
 from pydantic import BaseModel
-from typing import List, Optional, Any
-from fastapi import APIRouter, status, HTTPException
-from web3 import Account
-
-from api.models import AIAgent
-from api.deps import db_dependency, user_dependency
-from api.agent.agent import Agent, process_response
-from api.agent.prompt import get_system_prompt
+from typing import List, Optional, Any, Dict, Annotated
+from datetime import datetime
+from fastapi import APIRouter, status, HTTPException, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
+from api.models import AIAgent, Conversation, Message
+from api.database import AsyncSessionLocal
+from api.deps import async_db_dependency, user_dependency
+from api.agent.agent import (
+    Action,
+    AgentResponse,
+    AsyncAgent,
+    TRANSACTION_ACTIONS,
+    async_process_response,
+)
+from api.agent.prompt import get_system_prompt, prompt_cache
+from api.agent.zerepy import (
+    ZerePyError,
+    async_client as zerepy_async_client,
+    balance_cache,
+    async_get_balances,
+    inflight as zerepy_inflight,
+    single_flight_stats,
+)
+from api.agent.wallet import evm_address_from_key
+from api.agent.context import window_messages, CONVERSATION_MAX_MESSAGES
+from api.agent.intent import parse_intent, stats as intent_stats
+from api.agent import chat_cache
+from api import jobs
+from api.metrics import agent_actions
+from api.log import sampled
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/zerepy", tags=["zerepy"])
 
 
-openai_agent = Agent(model=os.getenv("OPENAI_MODEL"))
+openai_agent = AsyncAgent(model=os.getenv("OPENAI_MODEL"))
+
+ZEREPY_BATCH_CONCURRENCY = int(os.getenv("ZEREPY_BATCH_CONCURRENCY", "8"))
+ZEREPY_BATCH_MAX_ITEMS = int(os.getenv("ZEREPY_BATCH_MAX_ITEMS", "100"))
+# how often a job event stream re-reads the job when no change was notified
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "5"))
+PORTFOLIO_MAX_TOKENS = int(os.getenv("PORTFOLIO_MAX_TOKENS", "50"))
 
 
 class ZerepyRequest(BaseModel):
@@ -26,25 +63,156 @@ class ZerepyResponse(BaseModel):
     result: Any
 
 
+# only the columns the chat path needs
+chat_agent_columns = load_only(
+    AIAgent.agent_name,
+    AIAgent.agent_bio,
+    AIAgent.traits,
+    AIAgent.evm_address,
+    AIAgent.evm_private_key,
+    AIAgent.version,
+)
+
+
+async def get_chat_agent(db, user, agent_id: int) -> AIAgent:
+    # another user's agent is not found, its keys must never sign for the caller
+    agent = await db.scalar(
+        select(AIAgent)
+        .options(chat_agent_columns)
+        .where(AIAgent.id == agent_id, AIAgent.user_id == user["id"])
+    )
+
+    if agent is None:
+        raise HTTPException(status_code=404, detail="AIAgent not found")
+    return agent
+
+
+async def release_db(db):
+    """Return the request's pooled connection before waiting on the LLM.
+
+    Otherwise every chat in flight holds a connection and concurrency is
+    capped by the pool size. Loaded objects stay readable after close,
+    writes open a new session.
+    """
+    await db.close()
+
+
+# `Cache-Control: no-cache` skips the chat cache for a request
+cache_control_header = Annotated[Optional[str], Header()]
+
+
+def use_chat_cache(cache_control: Optional[str]) -> bool:
+    if not chat_cache.CHAT_CACHE_ENABLED:
+        return False
+    if cache_control and "no-cache" in cache_control.lower():
+        chat_cache.record_bypass()
+        return False
+    return True
+
+
+def latest_user_prompt(chat_history: List[Dict[str, str]]) -> Optional[str]:
+    if chat_history and chat_history[-1]["role"] == "user":
+        return chat_history[-1]["content"]
+    return None
+
+
+def ready_response(
+    agent: AIAgent, address: str, chat_history: List[Dict[str, str]], use_cache: bool
+) -> Optional[AgentResponse]:
+    """Answer from the intent fast path or the chat cache, without the LLM"""
+    response = parse_intent(latest_user_prompt(chat_history), address)
+    if response is None and use_cache:
+        response = chat_cache.get_cached_chat(agent.id, agent.version, chat_history)
+    return response
+
+
+async def agent_response(
+    agent: AIAgent,
+    address: str,
+    chat_history: List[Dict[str, str]],
+    system_prompt: str,
+    messages: List[Dict[str, str]],
+    use_cache: bool,
+) -> AgentResponse:
+    response = ready_response(agent, address, chat_history, use_cache)
+    if response is not None:
+        return response
+
+    response = await openai_agent.structured_call(
+        system_prompt=system_prompt,
+        messages=messages,
+    )
+    if use_cache:
+        chat_cache.store_chat(agent.id, agent.version, chat_history, response)
+    return response
+
+
+async def execute_response(
+    user, agent: AIAgent, response: AgentResponse, address: str
+) -> dict:
+    """Run the agent's answer, swaps and withdrawals become background jobs"""
+    if response.success and response.action in TRANSACTION_ACTIONS:
+        job = await jobs.enqueue_job(user["id"], agent.id, address, response)
+        agent_actions.inc(response.action.value, jobs.QUEUED)
+        return {
+            "status": jobs.QUEUED,
+            "action": response.action,
+            "result": {"job_id": job.id},
+        }
+    try:
+        res = await async_process_response(
+            response, private_key=agent.evm_private_key, address=address
+        )
+    except ZerePyError:
+        agent_actions.inc(response.action.value, "upstream_error")
+        raise
+    agent_actions.inc(Action(res["action"]).value, res["status"])
+    return res
+
+
+def log_result(agent: AIAgent, res: dict):
+    """Errors and queued jobs are always logged, the rest is sampled"""
+    action = Action(res["action"]).value
+    if res["status"] == "success":
+        logger.info("agent %s %s %s", agent.id, action, res["status"], extra=sampled())
+    else:
+        logger.info("agent %s %s %s", agent.id, action, res["status"])
+
+
+def accepted_if_queued(http_response: Response, res: "ZerepyResponse"):
+    if res.status == jobs.QUEUED:
+        http_response.status_code = status.HTTP_202_ACCEPTED
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=ZerepyResponse)
-def zerepy_request(db: db_dependency, user: user_dependency, request: ZerepyRequest):
+async def zerepy_request(
+    db: async_db_dependency,
+    user: user_dependency,
+    request: ZerepyRequest,
+    http_response: Response,
+    cache_control: cache_control_header = None,
+):
     # 1 user => pk
     # 2 prompt
 
-    prompt = request.prompt
-    print("prompt", prompt)
+    agent = await get_chat_agent(db, user, request.agent_id)
+    await release_db(db)
 
-    print("user", user)
+    res = await run_prompt(user, agent, request.prompt, use_chat_cache(cache_control))
+    accepted_if_queued(http_response, res)
+    return res
 
-    agent = db.query(AIAgent).filter(AIAgent.id == request.agent_id).first()
-    print("agent", agent)
 
-    pk = agent.evm_private_key
+async def run_prompt(user, agent: AIAgent, prompt: str, use_cache: bool) -> ZerepyResponse:
+    logger.debug("user %s prompt to agent %s, %d chars", user["id"], agent.id, len(prompt))
 
-    account = Account.from_key(pk)
-    address = account.address
+    pk = agent.evm_private_key
+    address = agent.evm_address or evm_address_from_key(pk)
 
-    response = openai_agent.structured_call(
+    response = await agent_response(
+        agent,
+        address,
+        chat_history=[{"role": "user", "content": prompt}],
         system_prompt=get_system_prompt(agent),
         messages=[
             {
@@ -58,18 +226,202 @@ def zerepy_request(db: db_dependency, user: user_dependency, request: ZerepyRequ
                 """,
             }
         ],
+        use_cache=use_cache,
     )
-    print(response)
 
-    res = process_response(response, private_key=pk)
-    print("res status", res["status"])
-    print("res result", res["result"])
+    res = await execute_response(user, agent, response, address)
+    log_result(agent, res)
 
     return ZerepyResponse(
         status=res["status"], action=res["action"], result=res["result"]
     )
 
 
+class ZerepyBatchRequest(BaseModel):
+    requests: List[ZerepyRequest]
+
+
+class ZerepyBatchItem(BaseModel):
+    response: Optional[ZerepyResponse] = None
+    error: Optional[str] = None
+
+
+@router.post("/batch", response_model=List[ZerepyBatchItem])
+async def zerepy_batch(
+    db: async_db_dependency,
+    user: user_dependency,
+    batch: ZerepyBatchRequest,
+    cache_control: cache_control_header = None,
+):
+    """Run many independent prompts concurrently.
+
+    Results come back in request order, a failing item only fails its own
+    entry.
+    """
+    if len(batch.requests) > ZEREPY_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {ZEREPY_BATCH_MAX_ITEMS} requests per batch",
+        )
+
+    # one query for all agents, the session must not be shared between tasks
+    agent_ids = {request.agent_id for request in batch.requests}
+    agents = {
+        agent.id: agent
+        for agent in await db.scalars(
+            select(AIAgent)
+            .options(chat_agent_columns)
+            .where(AIAgent.id.in_(agent_ids), AIAgent.user_id == user["id"])
+        )
+    }
+    await release_db(db)
+    use_cache = use_chat_cache(cache_control)
+    semaphore = asyncio.Semaphore(ZEREPY_BATCH_CONCURRENCY)
+
+    async def run(request: ZerepyRequest) -> ZerepyBatchItem:
+        agent = agents.get(request.agent_id)
+        if agent is None:
+            return ZerepyBatchItem(error="AIAgent not found")
+        async with semaphore:
+            try:
+                return ZerepyBatchItem(
+                    response=await run_prompt(user, agent, request.prompt, use_cache)
+                )
+            except Exception as e:
+                return ZerepyBatchItem(error=str(e))
+
+    return await asyncio.gather(*(run(request) for request in batch.requests))
+
+
+class PortfolioRequest(BaseModel):
+    tokens: List[str]
+    agent_id: Optional[int] = None
+    address: Optional[str] = None
+
+
+class PortfolioResponse(BaseModel):
+    address: str
+    balances: Dict[str, Dict[str, Any]]
+    complete: bool
+
+
+@router.post("/portfolio", response_model=PortfolioResponse)
+async def zerepy_portfolio(
+    db: async_db_dependency,
+    user: user_dependency,
+    request: PortfolioRequest,
+):
+    """Balances of many tokens (`0xnative` for S) in about one round trip.
+
+    Each token maps to `{"balance": ...}` or `{"error": ...}`, `complete` is
+    false when at least one token failed.
+    """
+    if len(request.tokens) > PORTFOLIO_MAX_TOKENS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {PORTFOLIO_MAX_TOKENS} tokens per portfolio",
+        )
+
+    if request.agent_id is not None:
+        agent = await db.scalar(
+            select(AIAgent)
+            .options(load_only(AIAgent.evm_address, AIAgent.evm_private_key))
+            .where(AIAgent.id == request.agent_id, AIAgent.user_id == user["id"])
+        )
+        if agent is None:
+            raise HTTPException(status_code=404, detail="AIAgent not found")
+        address = agent.evm_address or evm_address_from_key(agent.evm_private_key)
+        await release_db(db)
+    elif request.address:
+        address = request.address
+    else:
+        raise HTTPException(status_code=400, detail="agent_id or address is required")
+
+    balances = await async_get_balances(address, request.tokens)
+    return PortfolioResponse(
+        address=address,
+        balances=balances,
+        complete=all("error" not in balance for balance in balances.values()),
+    )
+
+
+@router.get("/stats")
+def zerepy_stats(user: user_dependency):
+    return {
+        "balance_cache": balance_cache.stats(),
+        "zerepy_client": zerepy_async_client.stats(),
+        "zerepy_single_flight": {**single_flight_stats, "in_flight": len(zerepy_inflight)},
+        "prompt_cache": prompt_cache.stats(),
+        "llm_usage": openai_agent.usage,
+        "intent_fast_path": intent_stats,
+        "chat_cache": chat_cache.stats(),
+        "transaction_lanes": jobs.lane_stats(),
+    }
+
+
+class JobResponse(BaseModel):
+    id: int
+    agent_id: int
+    action: str
+    status: str
+    result: Any = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+
+async def get_user_job(db, job_id: int, user) -> "jobs.TransactionJob":
+    job = await jobs.get_job(db, job_id, user["id"])
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_transaction_job(db: async_db_dependency, user: user_dependency, job_id: int):
+    return await get_user_job(db, job_id, user)
+
+
+@router.get("/jobs/{job_id}/events")
+async def transaction_job_events(db: async_db_dependency, user: user_dependency, job_id: int):
+    """Server-Sent Events of a job: a `status` event on every change, then `done`"""
+    await get_user_job(db, job_id, user)
+
+    async def event_stream():
+        last_status = None
+        while True:
+            event = jobs.watch(job_id)
+            try:
+                # the request session may be closed once streaming starts
+                async with AsyncSessionLocal() as job_db:
+                    job = await job_db.get(jobs.TransactionJob, job_id)
+                if job.status != last_status:
+                    last_status = job.status
+                    yield sse_event(
+                        "status",
+                        {field: getattr(job, field) for field in JobResponse.__fields__},
+                    )
+                if job.status in jobs.FINISHED:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), JOB_EVENTS_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                jobs.unwatch(job_id, event)
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 class ChatMessage(BaseModel):
     id: int
     conversation_id: int
@@ -79,40 +431,87 @@ class ChatMessage(BaseModel):
 
 
 class ZerepyRequestV2(BaseModel):
-    chat_history: List[ChatMessage]
+    chat_history: List[ChatMessage] = []
     agent_id: int
+    # with a conversation_id the client sends only the new prompt and the
+    # history is loaded from, and saved to, the messages table
+    conversation_id: Optional[int] = None
+    prompt: Optional[str] = None
+
+
+async def load_chat_history(db, user, request: ZerepyRequestV2) -> List[Dict[str, str]]:
+    # exactly one mode: conversation_id with prompt, or a client-side chat_history
+    if request.conversation_id is None:
+        if request.prompt is not None:
+            raise HTTPException(
+                status_code=400, detail="prompt is only accepted with conversation_id"
+            )
+        if not request.chat_history:
+            raise HTTPException(
+                status_code=400, detail="chat_history or conversation_id is required"
+            )
+        return [
+            {
+                "role": message.role,
+                "content": message.content,
+            }
+            for message in request.chat_history
+        ]
 
+    if not request.prompt:
+        raise HTTPException(
+            status_code=400, detail="prompt is required with conversation_id"
+        )
+    if request.chat_history:
+        raise HTTPException(
+            status_code=400, detail="chat_history is not accepted with conversation_id"
+        )
 
-@router.post("/v2", status_code=status.HTTP_201_CREATED, response_model=ZerepyResponse)
-def zerepy_request_v2(
-    db: db_dependency, user: user_dependency, request: ZerepyRequestV2
-):
-    # 1 user => pk
-    # 2 prompt
+    conversation_id = await db.scalar(
+        select(Conversation.id).where(
+            Conversation.id == request.conversation_id,
+            Conversation.agent_id == request.agent_id,
+            Conversation.user_id == user["id"],
+        )
+    )
+    if conversation_id is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
 
-    print("user", user)
+    db.add(Message(conversation_id=conversation_id, role="user", content=request.prompt))
+    await db.commit()
 
-    agent = db.query(AIAgent).filter(AIAgent.id == request.agent_id).first()
-    print("agent", agent)
+    rows = await db.execute(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.id.desc())
+        .limit(CONVERSATION_MAX_MESSAGES)
+    )
+    return window_messages(
+        [{"role": row.role, "content": row.content} for row in rows]
+    )
 
-    pk = agent.evm_private_key
 
-    account = Account.from_key(pk)
-    address = account.address
+async def save_reply(db, request: ZerepyRequestV2, res):
+    if request.conversation_id is None:
+        return
+    result = res["result"]
+    db.add(
+        Message(
+            conversation_id=request.conversation_id,
+            role="assistant",
+            content=result if isinstance(result, str) else json.dumps(jsonable_encoder(result)),
+        )
+    )
+    await db.commit()
 
-    system_prompt = get_system_prompt(agent)
 
-    messages = [
-        {
-            "role": message.role,
-            "content": message.content,
-        }
-        for message in request.chat_history
-    ]
+def build_chat_messages(chat_history: List[Dict[str, str]], address: str):
+    messages = [dict(message) for message in chat_history]
 
     # find last message with role "user" and add a prefix to the content
     last_user_message = next(
-        (message for message in messages if message["role"] == "user"), None
+        (message for message in reversed(messages) if message["role"] == "user"),
+        None,
     )
     if last_user_message:
         last_user_message["content"] = (
@@ -125,19 +524,146 @@ def zerepy_request_v2(
             """
         )
 
-    print("last user message", last_user_message)
-    print("messages", messages)
+    return messages
 
-    response = openai_agent.structured_call(
-        system_prompt=get_system_prompt(agent),
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@router.post("/v2", status_code=status.HTTP_201_CREATED, response_model=ZerepyResponse)
+async def zerepy_request_v2(
+    db: async_db_dependency,
+    user: user_dependency,
+    request: ZerepyRequestV2,
+    http_response: Response,
+    cache_control: cache_control_header = None,
+):
+    # 1 user => pk
+    # 2 prompt
+
+    agent = await get_chat_agent(db, user, request.agent_id)
+    logger.debug("user %s message to agent %s", user["id"], agent.id)
+
+    pk = agent.evm_private_key
+    address = agent.evm_address or evm_address_from_key(pk)
+
+    system_prompt = get_system_prompt(agent)
+
+    chat_history = await load_chat_history(db, user, request)
+    await release_db(db)
+    messages = build_chat_messages(chat_history, address)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "%d messages, %d chars", len(messages), sum(len(m["content"]) for m in messages)
+        )
+
+    response = await agent_response(
+        agent,
+        address,
+        chat_history=chat_history,
+        system_prompt=system_prompt,
         messages=messages,
+        use_cache=use_chat_cache(cache_control),
     )
-    print(response)
 
-    res = process_response(response, private_key=pk)
-    print("res status", res["status"])
-    print("res result", res["result"])
+    res = await execute_response(user, agent, response, address)
+    log_result(agent, res)
 
-    return ZerepyResponse(
+    async with AsyncSessionLocal() as reply_db:
+        await save_reply(reply_db, request, res)
+
+    res = ZerepyResponse(
         status=res["status"], action=res["action"], result=res["result"]
     )
+    accepted_if_queued(http_response, res)
+    return res
+
+
+@router.post("/v2/stream")
+async def zerepy_request_v2_stream(
+    db: async_db_dependency,
+    user: user_dependency,
+    request: ZerepyRequestV2,
+    cache_control: cache_control_header = None,
+):
+    """Server-Sent Events version of /v2.
+
+    Events: `partial` (partially parsed output), `action` (as soon as the
+    action is known), `message` (incremental chat text), `result` (the
+    process_response result), `error` and a closing `done`.
+    """
+    agent = await get_chat_agent(db, user, request.agent_id)
+
+    pk = agent.evm_private_key
+    address = agent.evm_address or evm_address_from_key(pk)
+
+    system_prompt = get_system_prompt(agent)
+    chat_history = await load_chat_history(db, user, request)
+    await release_db(db)
+    messages = build_chat_messages(chat_history, address)
+    use_cache = use_chat_cache(cache_control)
+    fast_response = ready_response(agent, address, chat_history, use_cache)
+
+    async def fast_path():
+        yield "partial", jsonable_encoder(fast_response)
+        yield "final", fast_response
+
+    async def event_stream():
+        action = None
+        sent_message = ""
+        try:
+            if fast_response is not None:
+                events = fast_path()
+            else:
+                events = openai_agent.structured_stream(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                )
+            async for kind, payload in events:
+                if kind == "final":
+                    if use_cache and fast_response is None:
+                        chat_cache.store_chat(
+                            agent.id, agent.version, chat_history, payload
+                        )
+                    res = await execute_response(user, agent, payload, address)
+                    log_result(agent, res)
+                    async with AsyncSessionLocal() as reply_db:
+                        await save_reply(reply_db, request, res)
+                    yield sse_event(
+                        "result",
+                        ZerepyResponse(
+                            status=res["status"],
+                            action=res["action"],
+                            result=res["result"],
+                        ),
+                    )
+                    continue
+
+                yield sse_event("partial", payload)
+
+                if action is None:
+                    try:
+                        action = Action(payload.get("action"))
+                    except ValueError:
+                        continue
+                    yield sse_event("action", {"action": action})
+
+                data = payload.get("data") or {}
+                message = data.get("message") if action == Action.CHAT else None
+                if isinstance(message, str) and len(message) > len(sent_message):
+                    yield sse_event("message", {"delta": message[len(sent_message):]})
+                    sent_message = message
+        except ZerePyError as e:
+            logger.warning("stream failed: %s", e)
+            yield sse_event("error", {"detail": e.to_dict()})
+        except Exception as e:
+            logger.exception("stream failed")
+            yield sse_event("error", {"detail": str(e)})
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
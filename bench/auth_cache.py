@@ -0,0 +1,46 @@
+"""Microbenchmark of get_current_user with and without the token cache.
+
+    python -m bench.auth_cache [iterations]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+from datetime import timedelta
+
+os.environ.setdefault("AUTH_SECRET_KEY", "bench-secret")
+os.environ.setdefault("AUTH_ALGORITHM", "HS256")
+
+from api import deps  # noqa: E402
+from api.routers.auth import create_access_token  # noqa: E402
+
+
+async def run(iterations: int, cached: bool) -> float:
+    deps.TOKEN_CACHE_ENABLED = cached
+    deps.token_cache.clear()
+    token = create_access_token("bench", 1, timedelta(minutes=20))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await deps.get_current_user(token)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    uncached = asyncio.run(run(iterations, cached=False))
+    cached = asyncio.run(run(iterations, cached=True))
+    print(
+        json.dumps(
+            {
+                "iterations": iterations,
+                "uncached_us_per_call": round(uncached, 2),
+                "cached_us_per_call": round(cached, 2),
+                "speedup": round(uncached / cached, 1),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Cold start of the app: seconds from spawning uvicorn to the first request
+served (/health/live) and to ready (/health/ready).
+
+Runs once with ZerePy up and once with ZerePy coming up `--zerepy-delay`
+seconds after the app was started.
+
+    python -m bench.cold_start [--runs 3] [--zerepy-delay 3]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+
+import httpx
+
+from bench import stub_zerepy
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def cold_start(zerepy_port: int, zerepy_delay: float, timeout: float = 60) -> dict:
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="cold-start-")
+    env = {
+        **os.environ,
+        "PYTHONPATH": APP_ROOT,
+        "ZEREPY_URL": f"http://127.0.0.1:{zerepy_port}",
+        "DATABASE_URL": f"sqlite:///{workdir}/cold_start.db",
+        "AUTH_SECRET_KEY": os.environ.get("AUTH_SECRET_KEY", "bench-secret"),
+        "AUTH_ALGORITHM": "HS256",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench"),
+    }
+
+    server = None
+    if zerepy_delay == 0:
+        server = stub_zerepy.start(zerepy_port)
+    else:
+        def late_start():
+            nonlocal server
+            server = stub_zerepy.start(zerepy_port)
+
+        timer = threading.Timer(zerepy_delay, late_start)
+        timer.start()
+
+    spawned = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        deadline = spawned + timeout
+        live = wait_for(base + "/health/live", deadline)
+        ready = wait_for(base + "/health/ready", deadline)
+        startup = httpx.get(base + "/health/ready").json()["startup"]
+    finally:
+        process.terminate()
+        process.wait()
+        if server is None:
+            timer.cancel()
+        else:
+            server.shutdown()
+            server.server_close()
+    return {
+        "first_request_seconds": round(live - spawned, 3),
+        "ready_seconds": round(ready - spawned, 3),
+        "app": startup,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--zerepy-delay", type=float, default=3.0)
+    args = parser.parse_args()
+
+    result = {}
+    for name, delay in (("zerepy_up", 0), ("zerepy_late", args.zerepy_delay)):
+        runs = [cold_start(free_port(), delay) for _ in range(args.runs)]
+        result[name] = {
+            "first_request_seconds": statistics.median(r["first_request_seconds"] for r in runs),
+            "ready_seconds": statistics.median(r["ready_seconds"] for r in runs),
+            "runs": runs,
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
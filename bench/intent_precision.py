@@ -0,0 +1,60 @@
+"""Measure precision and coverage of the rule based intent parser.
+
+Every line of intent_corpus.jsonl is a prompt with the intent the parser
+should produce, or null when the prompt has to go to the LLM.
+
+    python -m bench.intent_precision
+"""
+import sys
+import json
+from pathlib import Path
+
+from api.agent.intent import match_intent
+
+CORPUS = Path(__file__).with_name("intent_corpus.jsonl")
+USER_ADDRESS = "0x7EC6e6E82834754762E244A349fea27C51eB84b6"
+
+
+def matches(response, expected) -> bool:
+    data = response.data.dict()
+    return response.action.value == expected["action"] and all(
+        data.get(key) == value for key, value in expected.items() if key != "action"
+    )
+
+
+def main():
+    true_positives, false_positives, missed = 0, [], []
+    total = labeled = 0
+    for line in CORPUS.read_text().splitlines():
+        case = json.loads(line)
+        total += 1
+        response = match_intent(case["prompt"], USER_ADDRESS)
+        expected = case["expected"]
+        labeled += expected is not None
+        if response is None:
+            if expected is not None:
+                missed.append(case["prompt"])
+        elif expected is not None and matches(response, expected):
+            true_positives += 1
+        else:
+            false_positives.append(case["prompt"])
+
+    matched = true_positives + len(false_positives)
+    print(
+        json.dumps(
+            {
+                "prompts": total,
+                "matched": matched,
+                "precision": round(true_positives / matched, 4) if matched else None,
+                "coverage": round(true_positives / max(labeled, 1), 4),
+                "false_positives": false_positives,
+                "missed": missed,
+            },
+            indent=2,
+        )
+    )
+    return 1 if false_positives else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
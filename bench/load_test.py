@@ -0,0 +1,518 @@
+"""Load test of the app against local stub upstreams, results as JSON.
+
+Spawns the stub ZerePy (bench/stub_zerepy.py) and stub OpenAI
+(bench/stub_openai.py) servers and the app in their own processes, with a
+fresh SQLite database, seeds users, agents and conversations, then runs a
+weighted mix of requests at each concurrency level for a fixed time.
+
+    python -m bench.load_test [--concurrency 1,8,32] [--duration 15]
+        [--mix zerepy_chat=5,agents_list=2] [--openai-latency 0.3]
+        [--zerepy-latency 0.05] [--zerepy-fail-rate 0.02]
+        [--env CHAT_CACHE_ENABLED=1] [--output run.json] [--baseline old.json]
+
+Each level reports throughput, error rate and p50/p95/p99 latency, overall
+and per operation. Every response that is not 2xx counts as an error, so
+do 429 rejections from full wallet lanes. With --baseline, the throughput
+and p95/p99 of each level are compared to an earlier run of the same
+levels. The load generator shares the machine with the app, keep the
+setup identical when comparing commits.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+from bench.cold_start import APP_ROOT, free_port, wait_for
+
+# operation => weight, operations are the LoadTest methods of the same name
+DEFAULT_MIX = {
+    "token": 3,
+    "agents_list": 8,
+    "agents_summary": 5,
+    "agent_get": 8,
+    "agent_crud": 4,
+    "conversations_summary": 8,
+    "messages_list": 8,
+    "message_create": 8,
+    "zerepy_chat": 12,
+    "zerepy_balance": 12,
+    "zerepy_v2": 12,
+    "zerepy_v2_stream": 4,
+    "zerepy_swap": 2,
+}
+PASSWORD = "bench-password"
+RECIPIENT = "0x" + "33" * 20
+
+
+def agent_succeeded(response: httpx.Response) -> bool:
+    # the agent's failures are 2xx with an error status
+    return response.json().get("status") != "error"
+
+
+def stream_succeeded(response: httpx.Response) -> bool:
+    return "event: error" not in response.text
+
+
+class Recorder:
+    def __init__(self):
+        # operation => latencies in seconds, and status code => count
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, status: str, ok: bool):
+        self.latencies.setdefault(name, []).append(seconds)
+        counts = self.statuses.setdefault(name, {})
+        counts[status] = counts.get(status, 0) + 1
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / duration, 2),
+        "latency_ms": {
+            "mean": round(sum(ordered) / count * 1000, 2) if count else 0.0,
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if count else 0.0,
+        },
+    }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        # {"username", "headers", "agents": [{"id", "conversation_id"}]}
+        self.users: List[dict] = []
+        self.recorder = Recorder()
+        self.keys = 0
+
+    def next_key(self) -> str:
+        # distinct valid secp256k1 keys, so every agent has its own wallet lane
+        self.keys += 1
+        return "0x" + f"{self.keys:064x}"
+
+    async def request(
+        self, name: str, method: str, url: str, check=None, **kwargs
+    ) -> httpx.Response:
+        """`check(response)` is False for errors reported in a 2xx body"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(name, time.perf_counter() - start, type(e).__name__, False)
+            raise
+        elapsed = time.perf_counter() - start
+        status = str(response.status_code)
+        ok = response.is_success
+        if ok and check is not None and not check(response):
+            status += " error"
+            ok = False
+        self.recorder.record(name, elapsed, status, ok)
+        return response
+
+    async def login(self, user: dict, name: str = "token"):
+        response = await self.request(
+            name,
+            "POST",
+            "/auth/token",
+            data={"username": user["username"], "password": PASSWORD},
+        )
+        if response.is_success:
+            token = response.json()["access_token"]
+            user["headers"] = {"Authorization": f"Bearer {token}"}
+
+    async def create_agent(self, user: dict, name: str = "agent_create") -> httpx.Response:
+        return await self.request(
+            name,
+            "POST",
+            "/aiagents/",
+            headers=user["headers"],
+            json={
+                "agent_name": f"bench-{self.keys}",
+                "agent_bio": ["A load test agent"],
+                "traits": ["patient"],
+                "evm_private_key": self.next_key(),
+            },
+        )
+
+    async def seed(self, users: int, agents: int, messages: int):
+        for i in range(users):
+            user = {"username": f"bench-{i}", "agents": []}
+            response = await self.request(
+                "seed", "POST", "/auth/", json={"username": user["username"], "password": PASSWORD}
+            )
+            response.raise_for_status()
+            await self.login(user, "seed")
+            for _ in range(agents):
+                response = await self.create_agent(user, "seed")
+                response.raise_for_status()
+                agent_id = response.json()["id"]
+                response = await self.request(
+                    "seed",
+                    "POST",
+                    f"/aiagents/{agent_id}/conversations",
+                    headers=user["headers"],
+                    json={"agent_id": agent_id},
+                )
+                response.raise_for_status()
+                conversation_id = response.json()["id"]
+                for j in range(messages):
+                    await self.request(
+                        "seed",
+                        "POST",
+                        f"/aiagents/{agent_id}/conversations/{conversation_id}/messages",
+                        headers=user["headers"],
+                        json={"role": "user" if j % 2 == 0 else "assistant", "content": f"message {j}"},
+                    )
+                user["agents"].append({"id": agent_id, "conversation_id": conversation_id})
+            self.users.append(user)
+        self.recorder = Recorder()
+
+    # operations, each gets a random user and one of its agents
+
+    async def token(self, user, agent):
+        await self.login(user)
+
+    async def agents_list(self, user, agent):
+        await self.request("agents_list", "GET", "/aiagents/", headers=user["headers"])
+
+    async def agents_summary(self, user, agent):
+        await self.request("agents_summary", "GET", "/aiagents/summary", headers=user["headers"])
+
+    async def agent_get(self, user, agent):
+        await self.request("agent_get", "GET", f"/aiagents/{agent['id']}", headers=user["headers"])
+
+    async def agent_crud(self, user, agent):
+        response = await self.create_agent(user)
+        if not response.is_success:
+            return
+        body = response.json()
+        agent_id = body.pop("id")
+        body.pop("evm_address", None)
+        body["agent_bio"] = ["An updated load test agent"]
+        await self.request(
+            "agent_update", "PUT", f"/aiagents/{agent_id}", headers=user["headers"], json=body
+        )
+        await self.request(
+            "agent_delete", "DELETE", f"/aiagents/{agent_id}", headers=user["headers"]
+        )
+
+    async def conversations_summary(self, user, agent):
+        await self.request(
+            "conversations_summary",
+            "GET",
+            f"/aiagents/{agent['id']}/conversations/summary",
+            headers=user["headers"],
+        )
+
+    async def messages_list(self, user, agent):
+        await self.request(
+            "messages_list",
+            "GET",
+            f"/aiagents/{agent['id']}/conversations/{agent['conversation_id']}/messages",
+            headers=user["headers"],
+        )
+
+    async def message_create(self, user, agent):
+        await self.request(
+            "message_create",
+            "POST",
+            f"/aiagents/{agent['id']}/conversations/{agent['conversation_id']}/messages",
+            headers=user["headers"],
+            json={"role": "user", "content": "a note from the load test"},
+        )
+
+    async def zerepy_chat(self, user, agent):
+        await self.request(
+            "zerepy_chat",
+            "POST",
+            "/zerepy/",
+            headers=user["headers"],
+            check=agent_succeeded,
+            json={"agent_id": agent["id"], "prompt": f"tell me something nice #{self.rng.random()}"},
+        )
+
+    async def zerepy_balance(self, user, agent):
+        # matched by the intent fast path, no LLM call
+        await self.request(
+            "zerepy_balance",
+            "POST",
+            "/zerepy/",
+            headers=user["headers"],
+            check=agent_succeeded,
+            json={"agent_id": agent["id"], "prompt": "what is my balance"},
+        )
+
+    async def zerepy_v2(self, user, agent):
+        await self.request(
+            "zerepy_v2",
+            "POST",
+            "/zerepy/v2",
+            headers=user["headers"],
+            check=agent_succeeded,
+            json={
+                "agent_id": agent["id"],
+                "conversation_id": agent["conversation_id"],
+                "prompt": f"how is my wallet doing #{self.rng.random()}",
+            },
+        )
+
+    async def zerepy_v2_stream(self, user, agent):
+        # latency is until the last event
+        await self.request(
+            "zerepy_v2_stream",
+            "POST",
+            "/zerepy/v2/stream",
+            headers=user["headers"],
+            check=stream_succeeded,
+            json={
+                "agent_id": agent["id"],
+                "chat_history": [
+                    {"id": 1, "conversation_id": 1, "role": "user", "content": "say hello", "created_at": "now"}
+                ],
+            },
+        )
+
+    async def zerepy_swap(self, user, agent):
+        # 202 and a queued job, the swap itself runs in the wallet's lane
+        await self.request(
+            "zerepy_swap",
+            "POST",
+            "/zerepy/",
+            headers=user["headers"],
+            check=agent_succeeded,
+            json={"agent_id": agent["id"], "prompt": f"swap 0.01 S to {RECIPIENT}"},
+        )
+
+    async def worker(self, mix: Dict[str, int], deadline: float):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            user = self.rng.choice(self.users)
+            agent = self.rng.choice(user["agents"])
+            try:
+                await getattr(self, name)(user, agent)
+            except httpx.HTTPError:
+                pass
+
+    async def run_level(self, concurrency: int, duration: float, mix: Dict[str, int]) -> dict:
+        self.recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(self.worker(mix, deadline) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        recorder = self.recorder
+        everything = [seconds for values in recorder.latencies.values() for seconds in values]
+        result = {
+            "concurrency": concurrency,
+            "duration_seconds": round(elapsed, 2),
+            **summarize(everything, sum(recorder.errors.values()), elapsed),
+            "operations": {},
+        }
+        for name in sorted(recorder.latencies):
+            result["operations"][name] = {
+                **summarize(recorder.latencies[name], recorder.errors.get(name, 0), elapsed),
+                "status": recorder.statuses[name],
+            }
+        return result
+
+
+def spawn(args: List[str], env: dict, cwd: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def stub_args(module: str, port: int, prefix: str, args) -> List[str]:
+    return [
+        "-m", module,
+        "--port", str(port),
+        "--latency", str(getattr(args, f"{prefix}_latency")),
+        "--fail-rate", str(getattr(args, f"{prefix}_fail_rate")),
+        "--slow-rate", str(getattr(args, f"{prefix}_slow_rate")),
+        "--slow-latency", str(getattr(args, f"{prefix}_slow_latency")),
+    ]
+
+
+def parse_pairs(text: str) -> Dict[str, str]:
+    pairs = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        pairs[key] = value
+    return pairs
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=APP_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(levels: List[dict], baseline: dict) -> None:
+    """Add the change against the baseline level with the same concurrency"""
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+
+    def change(new: float, old: float):
+        return round((new - old) / old * 100, 1) if old else None
+
+    for level in levels:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        level["vs_baseline"] = {
+            "commit": baseline.get("commit"),
+            "throughput_change_pct": change(level["throughput_rps"], old["throughput_rps"]),
+            "p95_change_pct": change(level["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            "p99_change_pct": change(level["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+            "error_rate_change": round(level["error_rate"] - old["error_rate"], 4),
+        }
+
+
+async def drive(base: str, args, mix: Dict[str, int]) -> List[dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8)
+    async with httpx.AsyncClient(base_url=base, timeout=args.timeout, limits=limits) as client:
+        test = LoadTest(client, random.Random(args.seed))
+        await test.seed(args.users, args.agents, args.messages)
+        if args.warmup:
+            await test.run_level(args.concurrency[0], args.warmup, mix)
+        return [await test.run_level(level, args.duration, mix) for level in args.concurrency]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated levels")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds, not reported")
+    parser.add_argument("--mix", default="", help="operation=weight,..., replaces the default mix")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--agents", type=int, default=2, help="per user")
+    parser.add_argument("--messages", type=int, default=6, help="per seeded conversation")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--openai-fail-rate", type=float, default=0.0)
+    parser.add_argument("--openai-slow-rate", type=float, default=0.0)
+    parser.add_argument("--openai-slow-latency", type=float, default=3.0)
+    parser.add_argument("--zerepy-latency", type=float, default=0.05)
+    parser.add_argument("--zerepy-fail-rate", type=float, default=0.0)
+    parser.add_argument("--zerepy-slow-rate", type=float, default=0.0)
+    parser.add_argument("--zerepy-slow-latency", type=float, default=2.0)
+    parser.add_argument("--env", default="", help="KEY=VALUE,... passed to the app")
+    parser.add_argument("--output", help="also write the JSON to this file")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+
+    mix = {name: int(weight) for name, weight in parse_pairs(args.mix).items()} or DEFAULT_MIX
+    unknown = [name for name in mix if name not in DEFAULT_MIX]
+    if unknown:
+        parser.error(f"unknown operations {unknown}, known: {sorted(DEFAULT_MIX)}")
+
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    zerepy_port, openai_port, port = free_port(), free_port(), free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": APP_ROOT,
+        "ZEREPY_URL": f"http://127.0.0.1:{zerepy_port}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "DATABASE_URL": f"sqlite:///{workdir}/load_test.db",
+        "AUTH_SECRET_KEY": os.environ.get("AUTH_SECRET_KEY", "bench-secret"),
+        "AUTH_ALGORITHM": "HS256",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        **parse_pairs(args.env),
+    }
+
+    processes = [
+        spawn(stub_args("bench.stub_zerepy", zerepy_port, "zerepy", args), env, APP_ROOT),
+        spawn(stub_args("bench.stub_openai", openai_port, "openai", args), env, APP_ROOT),
+    ]
+    try:
+        deadline = time.perf_counter() + 30
+        wait_for(f"http://127.0.0.1:{zerepy_port}/", deadline)
+        wait_for(f"http://127.0.0.1:{openai_port}/v1/models", deadline)
+        processes.append(
+            spawn(["-m", "uvicorn", "main:app", "--port", str(port)], env, workdir)
+        )
+        base = f"http://127.0.0.1:{port}"
+        wait_for(base + "/health/ready", time.perf_counter() + 60)
+        levels = asyncio.run(drive(base, args, mix))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    result = {
+        "commit": git_commit(),
+        "config": {
+            "duration_seconds": args.duration,
+            "users": args.users,
+            "agents_per_user": args.agents,
+            "seed": args.seed,
+            "mix": mix,
+            "openai": {
+                "latency": args.openai_latency,
+                "fail_rate": args.openai_fail_rate,
+                "slow_rate": args.openai_slow_rate,
+                "slow_latency": args.openai_slow_latency,
+            },
+            "zerepy": {
+                "latency": args.zerepy_latency,
+                "fail_rate": args.zerepy_fail_rate,
+                "slow_rate": args.zerepy_slow_rate,
+                "slow_latency": args.zerepy_slow_latency,
+            },
+            "env": parse_pairs(args.env),
+        },
+        "levels": levels,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(levels, json.load(f))
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
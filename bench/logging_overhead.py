@@ -0,0 +1,118 @@
+"""Per-request cost of the old print() calls against the queued logger.
+
+Replays what one /zerepy/v2 request wrote before and after the switch to
+api/log.py, into a sink that takes `sink_ms` per write, e.g. a pipe the
+container runtime drains slowly. Times are measured in the request thread.
+
+    python -m bench.logging_overhead [requests] [sink_ms]
+"""
+import sys
+import json
+import time
+import logging
+
+from api import log
+from api.agent.agent import Action, AgentResponse, SwapResponse
+
+ADDRESS = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+PRIVATE_KEY = "0x" + "11" * 32
+USER = {"username": "bench", "id": 1}
+
+
+class SlowSink:
+    def __init__(self, sink_ms: float):
+        self.delay = sink_ms / 1000
+        self.writes = 0
+
+    def write(self, text: str):
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def fixtures():
+    messages = [
+        {"role": "user" if i % 2 else "assistant", "content": f"message {i} " * 20}
+        for i in range(20)
+    ]
+    response = AgentResponse(
+        success=True,
+        action=Action.SWAP,
+        data=SwapResponse(token_in="0xnative", token_out=ADDRESS, amount=1.0, action=Action.SWAP),
+    )
+    res = {"status": "queued", "action": Action.SWAP, "result": {"job_id": 1}}
+    return messages, response, res
+
+
+def print_request(sink, messages, response, res):
+    # the prints /zerepy/v2 and the swap path made before api/log.py
+    print("user", USER, file=sink)
+    print("agent", "bench", file=sink)
+    print("messages", messages, file=sink)
+    print(response, file=sink)
+    print("sonic_custom_swap", "0xnative", ADDRESS, "1.0", PRIVATE_KEY, "0.5", file=sink)
+    print("res status", res["status"], file=sink)
+    print("res result", res["result"], file=sink)
+
+
+router_logger = logging.getLogger("api.routers.zerepy")
+agent_logger = logging.getLogger("api.agent.agent")
+zerepy_logger = logging.getLogger("api.agent.zerepy")
+
+
+def log_request(messages, response, res):
+    # the calls that replaced them
+    data = response.data
+    router_logger.debug("user %s message to agent %s", USER["id"], 1)
+    if router_logger.isEnabledFor(logging.DEBUG):
+        router_logger.debug(
+            "%d messages, %d chars", len(messages), sum(len(m["content"]) for m in messages)
+        )
+    router_logger.info("agent %s %s %s", 1, response.action.value, res["status"])
+    agent_logger.info("swap %s %s to %s", data.amount, data.token_in, data.token_out)
+    zerepy_logger.info(
+        "custom-swap %s %s to %s, slippage %s", "1.0", "0xnative", ADDRESS, "0.5"
+    )
+    router_logger.info("agent %s %s %s", 1, "balance", "success", extra=log.sampled())
+
+
+def measure(fn, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sink_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    messages, response, res = fixtures()
+    results = {"requests": requests, "sink_ms": sink_ms}
+
+    sink = SlowSink(sink_ms)
+    results["print_us_per_request"] = round(
+        measure(lambda: print_request(sink, messages, response, res), requests), 1
+    )
+
+    for level in ("INFO", "DEBUG"):
+        sink = SlowSink(sink_ms)
+        log.setup_logging(sink)
+        for name in log.APP_LOGGERS:
+            logging.getLogger(name).setLevel(level)
+        elapsed = measure(lambda: log_request(messages, response, res), requests)
+        drain_start = time.perf_counter()
+        log.shutdown_logging()
+        results[f"log_{level.lower()}_us_per_request"] = round(elapsed, 1)
+        results[f"log_{level.lower()}_lines"] = sink.writes
+        results[f"log_{level.lower()}_drain_seconds"] = round(time.perf_counter() - drain_start, 3)
+        results[f"log_{level.lower()}_dropped"] = log.QueueHandler.dropped
+        log.QueueHandler.dropped = 0
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measure /aiagents and /zerepy latency while a login storm is running.
+
+Runs against an already started server:
+
+    python -m bench.login_storm --base-url http://localhost:8080 --logins 200
+
+Prints one JSON object with p50/p99 probe latencies before and during the
+storm and the status codes the logins got (503 means the bcrypt queue was
+full).
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import Counter
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def summary(samples: List[float]):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+async def probe(client: httpx.AsyncClient, headers, agent_id, duration: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get("/aiagents/", headers=headers)
+        if agent_id is not None:
+            await client.post(
+                "/zerepy/",
+                headers=headers,
+                json={"agent_id": agent_id, "prompt": "hi"},
+            )
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def storm(client: httpx.AsyncClient, username, password, logins, concurrency):
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            response = await client.post(
+                "/auth/token", data={"username": username, "password": password}
+            )
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return statuses
+
+
+async def main(args):
+    username, password = f"bench-{uuid.uuid4().hex[:8]}", "bench-password"
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        await client.post("/auth/", json={"username": username, "password": password})
+        response = await client.post(
+            "/auth/token", data={"username": username, "password": password}
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        baseline = await probe(client, headers, args.agent_id, args.duration)
+
+        storm_task = asyncio.create_task(
+            storm(client, username, password, args.logins, args.concurrency)
+        )
+        during = await probe(client, headers, args.agent_id, args.duration)
+        statuses = await storm_task
+
+    print(
+        json.dumps(
+            {
+                "baseline": summary(baseline),
+                "during_storm": summary(during),
+                "login_statuses": {str(code): n for code, n in statuses.items()},
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--agent-id", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,191 @@
+"""OpenAI-compatible stand-in with injectable faults, for benchmarks.
+
+    python -m bench.stub_openai [--port 8001] [--latency 0.2] [--fail-rate 0.05]
+        [--slow-rate 0.05] [--slow-latency 3]
+
+Serves /v1/models and /v1/chat/completions, streamed or not. The answer
+is an AgentResponse: a balance lookup when the last user message mentions
+a balance, a chat reply otherwise. Latency and faults work like
+bench/stub_zerepy.py, failures answer 500 so the OpenAI client raises.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_FAULTS = {
+    "latency": 0.0,
+    "fail_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_latency": 1.0,
+}
+ADDRESS = re.compile(r"0x[0-9a-fA-F]{40}")
+USAGE = {
+    "prompt_tokens": 400,
+    "completion_tokens": 40,
+    "total_tokens": 440,
+    "prompt_tokens_details": {"cached_tokens": 256},
+}
+# streamed answers are split into chunks of this many characters
+CHUNK = 16
+
+
+def answer(body: dict) -> dict:
+    users = [m for m in body.get("messages", []) if m.get("role") == "user"]
+    last = str(users[-1].get("content", "")) if users else ""
+    if "balance" in last.lower():
+        match = ADDRESS.search(last)
+        address = match.group(0) if match else "0x" + "00" * 20
+        return {
+            "success": True,
+            "action": "balance",
+            "data": {"address": address, "asset": "0xnative", "action": "balance"},
+            "error": None,
+        }
+    return {
+        "success": True,
+        "action": "chat",
+        "data": {"message": "Hello, how can I help with your wallet today?", "action": "chat"},
+        "error": None,
+    }
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def stream(self, base: dict, content: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = []
+        for i in range(0, len(content), CHUNK):
+            delta = {"role": "assistant", "content": content[i:i + CHUNK]}
+            events.append(
+                {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+            )
+        events.append(
+            {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": USAGE,
+            }
+        )
+        try:
+            for event in events:
+                self.write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.reply(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self.reply(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.reply(404, {"error": {"message": "not found"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.counts["stream" if body.get("stream") else "call"] += 1
+        faults = server.faults
+
+        if random.random() < faults["slow_rate"]:
+            time.sleep(faults["slow_latency"])
+        else:
+            time.sleep(faults["latency"])
+        if random.random() < faults["fail_rate"]:
+            self.reply(500, {"error": {"message": "injected fault", "type": "server_error"}})
+            return
+
+        content = json.dumps(answer(body))
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+        if body.get("stream"):
+            self.stream(base, content)
+            return
+        self.reply(
+            200,
+            {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": USAGE,
+            },
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port: int = 0, **faults) -> ThreadingHTTPServer:
+    """Serve in a daemon thread, ``server.url`` is the base url, /v1 included"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubOpenAIHandler)
+    server.daemon_threads = True
+    server.faults = {**DEFAULT_FAULTS, **faults}
+    server.counts = {"call": 0, "stream": 0}
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    server = start(
+        args.port,
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    print("stub OpenAI on", server.url, server.faults)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""ZerePy stand-in with injectable faults, for benchmarks and manual testing.
+
+    python -m bench.stub_zerepy [--port 8000] [--latency 0.05] [--fail-rate 0.2]
+        [--slow-rate 0.05] [--slow-latency 2]
+
+Every /agent/action call sleeps ``latency`` seconds, ``slow_rate`` of them
+sleep ``slow_latency`` instead and ``fail_rate`` of them answer 503.
+``faults`` can be changed while the server runs, ``counts`` holds the
+number of requests per action.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_FAULTS = {
+    "latency": 0.0,
+    "fail_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_latency": 1.0,
+}
+
+
+class StubZerePyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up, e.g. the loser of a hedged request
+            pass
+
+    def do_GET(self):
+        self.reply(200, {"status": "running"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length)) if length else {}
+        if not self.path.startswith("/agent/action"):
+            self.reply(200, {"status": "success"})
+            return
+
+        action = data.get("action")
+        server = self.server
+        with server.lock:
+            server.counts[action] = server.counts.get(action, 0) + 1
+        faults = server.faults
+
+        if random.random() < faults["slow_rate"]:
+            time.sleep(faults["slow_latency"])
+        else:
+            time.sleep(faults["latency"])
+        if random.random() < faults["fail_rate"]:
+            self.reply(503, {"detail": "injected fault"})
+            return
+
+        if action == "get-balance":
+            self.reply(200, {"status": "success", "result": 1.5})
+        else:
+            self.reply(200, {"status": "success", "result": {"tx_hash": "0x" + "ab" * 32}})
+
+    def log_message(self, *args):
+        pass
+
+
+def start(port: int = 0, **faults) -> ThreadingHTTPServer:
+    """Serve in a daemon thread, ``server.url`` is the base url"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubZerePyHandler)
+    server.daemon_threads = True
+    server.faults = {**DEFAULT_FAULTS, **faults}
+    server.counts = {}
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    server = start(
+        args.port,
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+    )
+    print("stub ZerePy on", server.url, server.faults)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Retries, circuit breaker and hedging of AsyncZerePyClient against
+bench.stub_zerepy with injected faults.
+
+    python -m bench.zerepy_resilience [calls]
+"""
+import sys
+import json
+import time
+import asyncio
+
+from api.agent.zerepy_client import AsyncZerePyClient, ZerePyError
+from bench import stub_zerepy
+
+
+def client_for(server, **options) -> AsyncZerePyClient:
+    options = {"backoff_base": 0.02, "backoff_max": 0.2, **options}
+    return AsyncZerePyClient(server.url, timeout=(1.0, 5.0), **options)
+
+
+async def balances(client: AsyncZerePyClient, calls: int, concurrency: int = 10):
+    """Run `calls` distinct get-balance calls, returns (latencies, errors)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], {}
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.perform_action("sonic", "get-balance", ["0xabc", f"0x{index:040x}"])
+            except ZerePyError as e:
+                errors[e.kind] = errors.get(e.kind, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(index) for index in range(calls)))
+    return sorted(latencies), errors
+
+
+def percentile(latencies, fraction):
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1)
+
+
+async def flaky(server, calls: int):
+    """30% of calls fail with 503, with and without retries"""
+    server.faults.update(fail_rate=0.3, latency=0.01, slow_rate=0.0)
+    result = {}
+    for retries in (0, 2):
+        server.counts.clear()
+        client = client_for(server, retries=retries, breaker_failures=1000)
+        _, errors = await balances(client, calls)
+        await client.aclose()
+        result[f"retries={retries}"] = {
+            "failed_calls": sum(errors.values()),
+            "upstream_requests": server.counts.get("get-balance", 0),
+        }
+    return result
+
+
+async def outage(server, calls: int):
+    """ZerePy answers 503 to everything, then recovers"""
+    server.faults.update(fail_rate=1.0, latency=0.01, slow_rate=0.0)
+    server.counts.clear()
+    client = client_for(server, retries=2, breaker_failures=5, breaker_reset=0.5)
+    latencies, errors = await balances(client, calls, concurrency=1)
+    during = {
+        "calls": calls,
+        "upstream_requests": server.counts.get("get-balance", 0),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.5),
+        "breaker": client.breaker("sonic").state,
+    }
+
+    server.faults.update(fail_rate=0.0)
+    await asyncio.sleep(0.6)
+    _, errors = await balances(client, 20, concurrency=1)
+    await client.aclose()
+    return {
+        "during_outage": during,
+        "after_recovery": {"errors": errors, "breaker": client.breaker("sonic").state},
+    }
+
+
+async def hedging(server, calls: int):
+    """5% of calls take a second, with and without hedging after 100 ms"""
+    server.faults.update(fail_rate=0.0, latency=0.02, slow_rate=0.05, slow_latency=1.0)
+    result = {}
+    for hedge_after in (None, 0.1):
+        server.counts.clear()
+        client = client_for(server, hedge_after=hedge_after)
+        latencies, errors = await balances(client, calls)
+        await client.aclose()
+        result[f"hedge_after={hedge_after}"] = {
+            "p50_ms": percentile(latencies, 0.5),
+            "p99_ms": percentile(latencies, 0.99),
+            "upstream_requests": server.counts.get("get-balance", 0),
+            "hedged": client.counters["hedged"],
+            "hedge_wins": client.counters["hedge_wins"],
+            "errors": errors,
+        }
+    return result
+
+
+async def run(calls: int):
+    server = stub_zerepy.start()
+    try:
+        return {
+            "calls": calls,
+            "flaky": await flaky(server, calls),
+            "outage": await outage(server, calls),
+            "hedging": await hedging(server, calls),
+        }
+    finally:
+        server.shutdown()
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(json.dumps(asyncio.run(run(calls)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
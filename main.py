@@ -1,21 +1,86 @@
-from fastapi import FastAPI
+import time
+
+# cold start is measured from here, see the startup entry of /health/ready
+IMPORT_STARTED = time.perf_counter()
+
+import math
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from api.routers import auth, aiagents, zerepy
+from api.routers import auth, aiagents, zerepy, health
 
 from api.database import Base, engine
+from api.migrations import migrate
+from api import jobs, metrics, log
+from api.agent.zerepy import connect as connect_zerepy, async_client as zerepy_client
+from api.agent.zerepy_client import ZerePyError
+from api.routers.zerepy import openai_agent
+
+logger = logging.getLogger(__name__)
+
+
+async def start_zerepy(app: FastAPI):
+    await connect_zerepy()
+    app.state.startup["zerepy_ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    logger.info("ZerePy ready", extra=app.state.startup)
+    jobs.set_zerepy_ready()
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifespan_started = time.perf_counter()
+    log.setup_logging()
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    await jobs.start_workers()
+    app.state.startup = {
+        "import_seconds": round(lifespan_started - IMPORT_STARTED, 3),
+        "lifespan_seconds": round(time.perf_counter() - lifespan_started, 3),
+        "zerepy_ready_seconds": None,
+    }
+    # ZerePy may still be starting, /health/ready is 503 until it is loaded
+    background = [
+        asyncio.create_task(start_zerepy(app)),
+        asyncio.create_task(openai_agent.warmup()),
+        asyncio.create_task(metrics.sample_loop_lag()),
+    ]
+    logger.info("started", extra=app.state.startup)
+    yield
+    for task in background:
+        task.cancel()
+    await jobs.stop_workers()
+    await zerepy_client.aclose()
+    await openai_agent.aclose()
+    log.shutdown_logging()
 
-Base.metadata.create_all(bind=engine)
 
+app = FastAPI(lifespan=lifespan)
 
+
+app.add_middleware(metrics.RequestMetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[log.REQUEST_ID_HEADER],
 )
+app.add_middleware(log.RequestIdMiddleware)
+
+
+@app.exception_handler(ZerePyError)
+async def zerepy_error_handler(request: Request, exc: ZerePyError):
+    headers = None
+    if exc.retry_after:
+        headers = {"Retry-After": str(math.ceil(exc.retry_after))}
+    logger.warning("%s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse(
+        status_code=exc.http_status, content={"detail": exc.to_dict()}, headers=headers
+    )
 
 
 @app.get("/")
@@ -23,6 +88,15 @@ def health_check():
     return "Health check complete"
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus text format, see api/metrics.py"""
+    if not metrics.METRICS_ENABLED:
+        return PlainTextResponse("", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(auth.router)
 app.include_router(aiagents.router)
 app.include_router(zerepy.router)
+app.include_router(health.router)
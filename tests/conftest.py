@@ -0,0 +1,26 @@
+import os
+
+# api.* reads its settings at import time
+os.environ.setdefault("AUTH_SECRET_KEY", "test-secret")
+os.environ.setdefault("AUTH_ALGORITHM", "HS256")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest  # noqa: E402
+
+from bench import stub_zerepy  # noqa: E402
+
+
+@pytest.fixture
+def zerepy_stub(monkeypatch):
+    """bench.stub_zerepy, with api.agent.zerepy talking to it on a clean cache"""
+    from api.agent import zerepy
+    from api.agent.zerepy_client import AsyncZerePyClient
+
+    server = stub_zerepy.start(latency=0.2)
+    monkeypatch.setattr(zerepy, "async_client", AsyncZerePyClient(server.url))
+    zerepy.balance_cache.clear()
+    zerepy.balance_generations.clear()
+    yield server
+    server.shutdown()
+    server.server_close()
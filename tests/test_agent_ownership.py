@@ -0,0 +1,50 @@
+"""Chat routes only run prompts against the caller's own agents."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from api.database import Base
+from api.models import User, AIAgent
+from api.routers import zerepy as zerepy_router
+from api.routers.zerepy import ZerepyBatchRequest, get_chat_agent, zerepy_batch
+
+
+async def with_foreign_agent(check):
+    """Run `check(db, caller, agent_id)` with an agent owned by someone else"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            owner = User(username="owner", hashed_password="x")
+            other = User(username="other", hashed_password="x")
+            db.add_all([owner, other])
+            await db.flush()
+            agent = AIAgent(user_id=owner.id, agent_name="owned", agent_bio=[], traits=[])
+            db.add(agent)
+            await db.commit()
+            return await check(db, {"username": other.username, "id": other.id}, agent.id)
+    finally:
+        await engine.dispose()
+
+
+def test_chat_agent_of_another_user_is_not_found():
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(with_foreign_agent(get_chat_agent))
+    assert excinfo.value.status_code == 404
+
+
+def test_batch_skips_agents_of_another_user(monkeypatch):
+    async def run_prompt(*args):
+        raise AssertionError("prompt ran against another user's agent")
+
+    monkeypatch.setattr(zerepy_router, "run_prompt", run_prompt)
+
+    async def check(db, user, agent_id):
+        batch = ZerepyBatchRequest(requests=[{"agent_id": agent_id, "prompt": "send 1 to 0x"}])
+        return await zerepy_batch(db, user, batch)
+
+    items = asyncio.run(with_foreign_agent(check))
+    assert [item.error for item in items] == ["AIAgent not found"]
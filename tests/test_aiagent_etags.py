@@ -0,0 +1,44 @@
+"""An agent created in place of a deleted one must not match the old ETag."""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from api.database import Base
+from api.models import User, AIAgent
+from api.routers.aiagents import delete_aiagent, get_aiagent, get_aiagent_summaries
+
+
+def request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+def add_agent(db: Session, user: dict, name: str) -> int:
+    agent = AIAgent(user_id=user["id"], agent_name=name, agent_bio=[], traits=[])
+    db.add(agent)
+    db.commit()
+    return agent.id
+
+
+def test_recreated_agent_gets_new_etags():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as db:
+        owner = User(username="etags", hashed_password="x")
+        db.add(owner)
+        db.commit()
+        user = {"username": owner.username, "id": owner.id}
+
+        agent_id = add_agent(db, user, "first")
+        agent_etag = get_aiagent(db, user, request(), agent_id, fields=None).headers["etag"]
+        summary_etag = get_aiagent_summaries(db, user, request()).headers["etag"]
+
+        delete_aiagent(db, user, agent_id)
+        new_id = add_agent(db, user, "second")
+        assert new_id != agent_id
+
+        assert get_aiagent(db, user, request(agent_etag), new_id, fields=None).status_code == 200
+        assert get_aiagent_summaries(db, user, request(summary_etag)).status_code == 200
+        summary_etag = get_aiagent_summaries(db, user, request()).headers["etag"]
+        assert get_aiagent_summaries(db, user, request(summary_etag)).status_code == 304
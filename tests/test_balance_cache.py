@@ -0,0 +1,33 @@
+import asyncio
+
+from api.agent import zerepy
+
+ADDRESS = "0x" + "22" * 20
+
+
+def test_read_in_flight_during_invalidation_is_not_cached(zerepy_stub):
+    async def run():
+        stale = asyncio.create_task(zerepy.async_get_balance(ADDRESS, "0xnative"))
+        await asyncio.sleep(0.05)
+        # a swap of ADDRESS completes while the read is in flight
+        zerepy.invalidate_balances(ADDRESS)
+        fresh = asyncio.create_task(zerepy.async_get_balance(ADDRESS, "0xnative"))
+        await stale
+        assert zerepy.balance_cache.get(zerepy._balance_key(ADDRESS, "0xnative")) is None
+        await fresh
+        await zerepy.async_client.aclose()
+
+    asyncio.run(run())
+    # the read after the invalidation did not join the older one
+    assert zerepy_stub.counts["get-balance"] == 2
+    assert zerepy.balance_cache.get(zerepy._balance_key(ADDRESS, "0xnative")) is not None
+
+
+def test_reads_are_cached_without_invalidation(zerepy_stub):
+    async def run():
+        await zerepy.async_get_balance(ADDRESS, "0xnative")
+        await zerepy.async_get_balance(ADDRESS, "0xnative")
+        await zerepy.async_client.aclose()
+
+    asyncio.run(run())
+    assert zerepy_stub.counts["get-balance"] == 1
@@ -0,0 +1,34 @@
+"""/zerepy/v2 takes either a conversation_id with a prompt or a chat_history."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api.routers.zerepy import ZerepyRequestV2, load_chat_history
+
+USER = {"username": "chat", "id": 1}
+MESSAGE = {"id": 1, "conversation_id": 1, "role": "user", "content": "hi", "created_at": ""}
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {},
+        {"prompt": "hi"},
+        {"conversation_id": 1},
+        {"conversation_id": 1, "prompt": "hi", "chat_history": [MESSAGE]},
+        {"chat_history": [MESSAGE], "prompt": "hi"},
+    ],
+    ids=["empty", "prompt-only", "no-prompt", "both", "history-and-prompt"],
+)
+def test_incomplete_or_mixed_modes_are_rejected(fields):
+    request = ZerepyRequestV2(agent_id=1, **fields)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(load_chat_history(None, USER, request))
+    assert excinfo.value.status_code == 400
+
+
+def test_client_side_history_is_used_as_is():
+    request = ZerepyRequestV2(agent_id=1, chat_history=[MESSAGE])
+    history = asyncio.run(load_chat_history(None, USER, request))
+    assert history == [{"role": "user", "content": "hi"}]
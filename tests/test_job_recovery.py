@@ -0,0 +1,78 @@
+"""Jobs recovered at startup run first, and nothing runs before ZerePy is up."""
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from api import jobs
+from api.agent.agent import Action, AgentResponse, WithdrawResponse
+from api.database import Base
+from api.models import User, AIAgent, TransactionJob
+
+WALLET = "0x" + "11" * 20
+TO_ADDRESS = "0x" + "22" * 20
+
+
+def withdraw() -> AgentResponse:
+    return AgentResponse(
+        success=True,
+        action=Action.WITHDRAW,
+        data=WithdrawResponse(
+            from_address=WALLET,
+            to_address=TO_ADDRESS,
+            amount=1.0,
+            asset="0xnative",
+            action=Action.WITHDRAW,
+        ),
+    )
+
+
+def test_recovered_jobs_run_before_new_ones(tmp_path, monkeypatch):
+    ran = []
+
+    async def run_job(job_id):
+        ran.append(job_id)
+
+    monkeypatch.setattr(jobs, "run_job", run_job)
+
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        monkeypatch.setattr(jobs, "AsyncSessionLocal", sessions)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with sessions() as db:
+                user = User(username="jobs", hashed_password="x")
+                db.add(user)
+                await db.flush()
+                agent = AIAgent(
+                    user_id=user.id, agent_name="jobs", agent_bio=[], traits=[], evm_address=WALLET
+                )
+                db.add(agent)
+                await db.flush()
+                queued = TransactionJob(
+                    user_id=user.id,
+                    agent_id=agent.id,
+                    action="withdraw",
+                    request={},
+                    status=jobs.QUEUED,
+                )
+                db.add(queued)
+                await db.commit()
+
+            await jobs.start_workers()
+            assert jobs.get_lane(WALLET).depth == 1
+            new = await jobs.enqueue_job(user.id, agent.id, WALLET, withdraw())
+            await asyncio.sleep(0.05)
+            ran_before_ready = list(ran)
+
+            jobs.set_zerepy_ready()
+            await asyncio.wait_for(jobs.get_lane(WALLET).task, 1)
+            return ran_before_ready, [queued.id, new.id]
+        finally:
+            await jobs.stop_workers()
+            await engine.dispose()
+
+    ran_before_ready, order = asyncio.run(main())
+    assert ran_before_ready == []
+    assert ran == order
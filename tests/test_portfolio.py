@@ -0,0 +1,71 @@
+"""Portfolio lookups stay within their concurrency and the caller's agents."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from api.agent import zerepy
+from api.database import Base
+from api.models import User, AIAgent
+from api.routers.zerepy import PortfolioRequest, zerepy_portfolio
+
+ADDRESS = "0x" + "11" * 20
+
+
+def test_timed_out_lookups_keep_their_slot(monkeypatch):
+    active = peak = started = 0
+
+    async def upstream():
+        nonlocal active, peak, started
+        active += 1
+        started += 1
+        peak = max(peak, active)
+        try:
+            await asyncio.sleep(0.2)
+            return {"result": "1"}
+        finally:
+            active -= 1
+
+    async def slow_balance(address, token_address):
+        # like the single-flight reads, the upstream request outlives its caller
+        return await asyncio.shield(asyncio.ensure_future(upstream()))
+
+    monkeypatch.setattr(zerepy, "async_get_balance", slow_balance)
+    tokens = [f"0xtoken{i}" for i in range(6)]
+
+    async def run():
+        balances = await zerepy.async_get_balances(ADDRESS, tokens, concurrency=2, timeout=0.05)
+        await asyncio.sleep(0.3)
+        return balances
+
+    balances = asyncio.run(run())
+    assert all("error" in balance for balance in balances.values())
+    assert started == len(tokens)
+    assert peak == 2
+
+
+def test_portfolio_of_another_users_agent_is_not_found():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            owner = User(username="owner", hashed_password="x")
+            other = User(username="other", hashed_password="x")
+            db.add_all([owner, other])
+            await db.flush()
+            agent = AIAgent(
+                user_id=owner.id, agent_name="owned", agent_bio=[], traits=[], evm_address=ADDRESS
+            )
+            db.add(agent)
+            await db.commit()
+            request = PortfolioRequest(tokens=["0xnative"], agent_id=agent.id)
+            try:
+                await zerepy_portfolio(db, {"username": other.username, "id": other.id}, request)
+            finally:
+                await engine.dispose()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 404
@@ -0,0 +1,83 @@
+"""The paginated list endpoints must walk their composite index.
+
+Calls the conversation and message list routes against an in-memory
+database and runs EXPLAIN QUERY PLAN on every paginated statement they
+issue. A table scan or a temp b-tree sort means an index regressed.
+"""
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from api.database import Base
+from api.models import User, AIAgent, Conversation, Message
+from api.routers.aiagents import (
+    get_conversations,
+    get_conversation_summaries,
+    get_messages,
+)
+
+EXPECTED_INDEXES = {
+    "conversations": "ix_conversations_agent_id_user_id_id",
+    "messages": "ix_messages_conversation_id_id",
+}
+
+
+def seed(db: Session):
+    user = User(username="plans", hashed_password="x")
+    db.add(user)
+    db.flush()
+    agent = AIAgent(user_id=user.id, agent_name="plans", agent_bio=[], traits=[])
+    db.add(agent)
+    db.flush()
+    for _ in range(3):
+        conversation = Conversation(user_id=user.id, agent_id=agent.id)
+        db.add(conversation)
+        db.flush()
+        db.add_all(
+            Message(conversation_id=conversation.id, role="user", content="hi")
+            for _ in range(5)
+        )
+    db.commit()
+    return {"username": user.username, "id": user.id}, agent.id, conversation.id
+
+
+@pytest.mark.parametrize(
+    "before, after", [(None, None), (10, None), (None, 2)], ids=["first", "before", "after"]
+)
+def test_paginated_lists_use_their_index(before, after):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    statements = []
+
+    with Session(engine) as db:
+        user, agent_id, conversation_id = seed(db)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append((statement, parameters))
+
+        get_conversations(db, user, agent_id, limit=2, before=before, after=after)
+        get_conversation_summaries(db, user, agent_id, limit=2, before=before, after=after)
+        get_messages(db, user, agent_id, conversation_id, limit=2, before=before, after=after)
+
+    checked = set()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if "ORDER BY" not in statement or "LIMIT" not in statement:
+                continue
+            plan = [
+                row[-1]
+                for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            ]
+            for table, index in EXPECTED_INDEXES.items():
+                if f"FROM {table}" not in statement:
+                    continue
+                checked.add(table)
+                assert any(index in line for line in plan), (statement, plan)
+                assert not any(
+                    line.startswith("SCAN") or "TEMP B-TREE" in line for line in plan
+                ), (statement, plan)
+
+    # the routes still issue the paginated queries this test is about
+    assert checked == set(EXPECTED_INDEXES)
@@ -0,0 +1,44 @@
+"""Concurrent identical ZerePy reads share one upstream request, writes never do."""
+import asyncio
+
+import pytest
+
+from api.agent import zerepy
+
+ADDRESS = "0x" + "11" * 20
+CONCURRENCY = 50
+
+
+def test_identical_reads_share_one_request(zerepy_stub):
+    async def run():
+        results = await asyncio.gather(
+            *(zerepy.async_get_balance(ADDRESS, "0xnative") for _ in range(CONCURRENCY))
+        )
+        await zerepy.async_client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert all(result == results[0] for result in results)
+    assert zerepy_stub.counts["get-balance"] == 1
+
+
+def test_writes_are_not_coalesced(zerepy_stub):
+    async def run():
+        await asyncio.gather(
+            *(
+                zerepy.async_transfer_sonic_custom(ADDRESS, "1", "0xkey")
+                for _ in range(CONCURRENCY)
+            )
+        )
+        await zerepy.async_client.aclose()
+
+    asyncio.run(run())
+    assert zerepy_stub.counts["custom-transfer"] == CONCURRENCY
+
+
+def test_write_actions_are_refused():
+    async def run():
+        await zerepy.async_read_action("sonic", "custom-swap", [])
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,95 @@
+"""A write that may have reached the chain is never reported as failed."""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from api import jobs
+from api.agent import zerepy
+from api.agent.zerepy_client import AsyncZerePyClient
+from api.database import Base
+from api.models import User, AIAgent, TransactionJob
+
+TO_ADDRESS = "0x" + "22" * 20
+PRIVATE_KEY = "0x" + "33" * 32
+
+
+def run_withdraw(tmp_path, monkeypatch) -> TransactionJob:
+    """Queue a withdraw in a fresh database, run it and return the job row"""
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+        sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        monkeypatch.setattr(jobs, "AsyncSessionLocal", sessions)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with sessions() as db:
+                user = User(username="jobs", hashed_password="x")
+                db.add(user)
+                await db.flush()
+                agent = AIAgent(
+                    user_id=user.id,
+                    agent_name="jobs",
+                    agent_bio=[],
+                    traits=[],
+                    evm_private_key=PRIVATE_KEY,
+                )
+                db.add(agent)
+                await db.flush()
+                job = TransactionJob(
+                    user_id=user.id,
+                    agent_id=agent.id,
+                    action="withdraw",
+                    request={
+                        "from_address": "0x" + "11" * 20,
+                        "to_address": TO_ADDRESS,
+                        "amount": 1.0,
+                        "asset": "0xnative",
+                        "action": "withdraw",
+                    },
+                    status=jobs.QUEUED,
+                )
+                db.add(job)
+                await db.commit()
+            await jobs.run_job(job.id)
+            async with sessions() as db:
+                return await db.get(TransactionJob, job.id)
+        finally:
+            await zerepy.async_client.aclose()
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_write_that_timed_out_is_interrupted(zerepy_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        zerepy,
+        "async_client",
+        AsyncZerePyClient(zerepy_stub.url, action_timeouts={"custom-transfer": (1.0, 0.05)}),
+    )
+    job = run_withdraw(tmp_path, monkeypatch)
+    assert job.status == jobs.INTERRUPTED
+    assert jobs.UNCERTAIN_ERROR in job.error
+    assert zerepy_stub.counts["custom-transfer"] == 1
+
+
+def test_write_that_got_a_server_error_is_interrupted(zerepy_stub, tmp_path, monkeypatch):
+    zerepy_stub.faults["fail_rate"] = 1.0
+    job = run_withdraw(tmp_path, monkeypatch)
+    assert job.status == jobs.INTERRUPTED
+
+
+@pytest.mark.parametrize("kind", ["connect", "circuit_open"])
+def test_write_that_was_never_sent_fails(zerepy_stub, tmp_path, monkeypatch, kind):
+    if kind == "connect":
+        # nothing listens on port 1
+        client = AsyncZerePyClient("http://127.0.0.1:1")
+    else:
+        client = AsyncZerePyClient(zerepy_stub.url)
+        for _ in range(client.breaker_failures):
+            client.breaker("sonic").record_failure()
+    monkeypatch.setattr(zerepy, "async_client", client)
+    job = run_withdraw(tmp_path, monkeypatch)
+    assert job.status == jobs.FAILED
+    assert zerepy_stub.counts.get("custom-transfer", 0) == 0
@@ -0,0 +1,90 @@
+"""Retries and circuit breaker of AsyncZerePyClient against a faulty stub."""
+import asyncio
+
+import pytest
+
+from api.agent.zerepy_client import AsyncZerePyClient, ZerePyError
+
+BALANCE_PARAMS = ["0x" + "11" * 20, "0xnative"]
+TRANSFER_PARAMS = ["0x" + "22" * 20, "1", "0xkey", None]
+
+
+def client_for(server, **options) -> AsyncZerePyClient:
+    options = {"backoff_base": 0.01, "backoff_max": 0.05, **options}
+    return AsyncZerePyClient(server.url, **options)
+
+
+async def call(client: AsyncZerePyClient, action: str = "get-balance"):
+    params = BALANCE_PARAMS if action == "get-balance" else TRANSFER_PARAMS
+    return await client.perform_action("sonic", action, params)
+
+
+def run(client: AsyncZerePyClient, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_reads_are_retried_then_raise(zerepy_stub):
+    zerepy_stub.faults["fail_rate"] = 1.0
+    client = client_for(zerepy_stub, retries=2)
+    with pytest.raises(ZerePyError) as excinfo:
+        run(client, call(client))
+    assert excinfo.value.status_code == 503
+    assert zerepy_stub.counts["get-balance"] == 3
+
+
+def test_writes_are_sent_once(zerepy_stub):
+    zerepy_stub.faults["fail_rate"] = 1.0
+    client = client_for(zerepy_stub, retries=2)
+    with pytest.raises(ZerePyError) as excinfo:
+        run(client, call(client, "custom-transfer"))
+    assert excinfo.value.status_code == 503
+    assert zerepy_stub.counts["custom-transfer"] == 1
+
+
+def test_open_breaker_fails_fast(zerepy_stub):
+    zerepy_stub.faults["fail_rate"] = 1.0
+    client = client_for(zerepy_stub, retries=0, breaker_failures=3)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(ZerePyError):
+                await call(client)
+        sent = zerepy_stub.counts["get-balance"]
+        with pytest.raises(ZerePyError) as excinfo:
+            await call(client)
+        return sent, excinfo.value
+
+    sent, error = run(client, main())
+    assert sent == 3
+    assert error.kind == "circuit_open"
+    assert zerepy_stub.counts["get-balance"] == sent
+
+
+def test_breaker_lets_one_probe_through_after_reset(zerepy_stub):
+    zerepy_stub.faults["fail_rate"] = 1.0
+    client = client_for(zerepy_stub, retries=0, breaker_failures=2, breaker_reset=0.3)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(ZerePyError):
+                await call(client)
+        zerepy_stub.faults["fail_rate"] = 0.0
+        await asyncio.sleep(0.3)
+        # the probe is in flight, the second call is still rejected
+        results = await asyncio.gather(call(client), call(client), return_exceptions=True)
+        after_probe = zerepy_stub.counts["get-balance"]
+        await call(client)
+        return results, after_probe
+
+    (probe, rejected), after_probe = run(client, main())
+    assert probe["result"] == 1.5
+    assert isinstance(rejected, ZerePyError) and rejected.kind == "circuit_open"
+    assert after_probe == 3
+    assert client.breaker("sonic").state == "closed"
+    assert zerepy_stub.counts["get-balance"] == 4